@@ -0,0 +1,54 @@
+#! /usr/bin/env python
+
+'''
+Benchmark: pre-filtering variants by their anchors.
+
+A git-style spec has one variant per subcommand. Its first positional arg
+picks the candidate variants via ArgvEngine.anchors. This script compares
+parsing a late subcommand with and without that index, for two paths:
+
+    nfa     | The DFA is disabled, so the NFA is simulated.
+    scan    | The variants disagree on an option's parameters, so
+            | each candidate variant scans the args itself.
+
+Usage:
+    python benchmarks/bench_anchor_index.py [N_REPEATS]
+'''
+
+import sys
+
+from timeit import timeit
+
+from argle.engine import AnchorIndex, ArgvEngine
+
+def git_style_spec(n, mixed_params = False):
+    # A spec with n subcommands. With mixed_params, --opt takes one
+    # parameter in even variants and two in odd ones.
+    lines = []
+    for i in range(n):
+        params = '<a> <b>' if mixed_params and i % 2 else '<a>'
+        lines.append(f'cmd{i} : <command=cmd{i}> <src> [<dst>] [--opt {params}] [--verbose]')
+    return '\n'.join(lines) + '\n'
+
+def main(args):
+    k = int(args[0]) if args else 200
+
+    print('# Parse time for the second-to-last subcommand (usec)')
+    print(f'{"path":<6} {"variants":>8} {"all":>9} {"anchors":>9}')
+    for n in (10, 50, 200):
+        argv_tmpl = 'cmd{} SRC DST --opt A --verbose'
+        for path in ('nfa', 'scan'):
+            e = ArgvEngine.from_spec(git_style_spec(n, mixed_params = path == 'scan'))
+            if path == 'nfa':
+                e.dfa = None
+            argv = argv_tmpl.format(n - 2).split()
+            anchors = e.anchors
+            no_anchors = AnchorIndex(unanchored = list(range(n)))
+            usecs = []
+            for index in (no_anchors, anchors):
+                e.anchors = index
+                usecs.append(timeit(lambda: e.parse(argv), number = k) / k * 1e6)
+            print(f'{path:<6} {n:>8} {usecs[0]:>9.1f} {usecs[1]:>9.1f}')
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,67 @@
+#! /usr/bin/env python
+
+'''
+Benchmark: memory and time of converting a SpecAST to a Grammar.
+
+SpecParser.ast_to_parsed_spec() used to start with deepcopy(ast), because
+the conversion modified the SpecAST. The conversion is now pure, so the
+copy is gone. This script measures, for each spec, the time and the peak
+memory (via tracemalloc) of:
+
+    convert   | ast_to_parsed_spec(ast), as it is now.
+    deepcopy  | deepcopy(ast): the cost removed from the conversion.
+
+Besides the example specs, it uses a generated spec with N variants
+sharing a partial-variant.
+
+Usage:
+    python benchmarks/bench_ast_convert.py [N_VARIANTS]
+'''
+
+import sys
+import tracemalloc
+
+from copy import deepcopy
+from pathlib import Path
+from time import perf_counter
+
+from argle.spec_parser import SpecParser
+
+SPECS_DIR = Path(__file__).parent.parent / 'tests' / 'data' / 'specs'
+
+def big_spec(n):
+    lines = ['general! : [--verbose] [--config <k> <v>]... [--help]']
+    lines.extend(
+        f'cmd{i} : general! <command=cmd{i}> <src> [<dst>]... '
+        f'[--opt{i} <x>] (--fast | --slow) [`a` | `b` | <c=x|y>]'
+        for i in range(n)
+    )
+    return '\n'.join(lines) + '\n'
+
+def measure(func):
+    # Returns (MSEC, PEAK_MB) for one call of func.
+    t0 = perf_counter()
+    func()
+    secs = perf_counter() - t0
+    tracemalloc.start()
+    func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return (secs * 1000, peak / 2 ** 20)
+
+def main(args):
+    n = int(args[0]) if args else 500
+    specs = [(p.stem, p.read_text()) for p in sorted(SPECS_DIR.glob('*.txt'))]
+    specs.append((f'big-{n}', big_spec(n)))
+
+    print('# Convert vs deepcopy: time (msec), peak memory (MB)')
+    print(f'{"spec":<14} {"convert":>9} {"peak":>7} {"deepcopy":>9} {"peak":>7}')
+    for name, text in specs:
+        sp = SpecParser(text)
+        ast = sp.parse().grammar
+        conv = measure(lambda: sp.ast_to_parsed_spec(ast))
+        copy = measure(lambda: deepcopy(ast))
+        print(f'{name:<14} {conv[0]:>9.2f} {conv[1]:>7.2f} {copy[0]:>9.2f} {copy[1]:>7.2f}')
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
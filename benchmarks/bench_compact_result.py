@@ -0,0 +1,66 @@
+#! /usr/bin/env python
+
+'''
+Benchmark: memory and time of Result vs CompactResult for large parses.
+
+Parses N file paths (plus a few options) with and without
+Parser(compact = True), measuring the memory held by the Result with
+tracemalloc, the parse time, and the time of repr(). Two inputs:
+
+    stream | Args streamed from a generator, as when reading them from a
+           | file, so the Result is the only holder of the str objects.
+           | A CompactResult packs the values (PackedStrs).
+
+    list   | Args in a list. A CompactResult records spans of the
+           | list (ArgsView).
+
+Usage:
+    python benchmarks/bench_compact_result.py [N_ARGS]
+'''
+
+import sys
+import tracemalloc
+
+from time import perf_counter
+
+from argle import Parser
+
+def main(args):
+    n = int(args[0]) if args else 10 ** 6
+    opts = ['-v', '--max-depth', '3', '--']
+
+    def argv():
+        yield from opts
+        for i in range(n):
+            yield f'src/pkg{i % 97}/module_{i}.py'
+
+    argv_list = list(argv())
+    inputs = (('stream', argv), ('list', lambda: argv_list))
+
+    print(f'# {n} args: memory (MB), parse (msec), repr (msec)')
+    for input_label, get_args in inputs:
+        for compact in (False, True):
+            p = Parser(compact = compact)
+
+            # Parse time.
+            t0 = perf_counter()
+            p.parse(get_args())
+            parse_secs = perf_counter() - t0
+
+            # Memory held by the result.
+            tracemalloc.start()
+            before = tracemalloc.get_traced_memory()[0]
+            res = p.parse(get_args())
+            mb = (tracemalloc.get_traced_memory()[0] - before) / 2 ** 20
+            tracemalloc.stop()
+
+            # Repr.
+            t0 = perf_counter()
+            repr(res)
+            repr_secs = perf_counter() - t0
+
+            label = f'{input_label} {type(res).__name__}'
+            print(f'{label:<22} {mb:>8.1f} {parse_secs * 1000:>9.1f} {repr_secs * 1000:>9.1f}')
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
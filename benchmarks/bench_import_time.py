@@ -0,0 +1,71 @@
+#! /usr/bin/env python
+
+'''
+Benchmark: import time of `from argle import Parser`.
+
+Runs the import in fresh interpreters under `python -X importtime` and
+reports the cumulative time (best of N runs) for the argle modules and for
+the heavier modules that a no-config script should not need. Exits with
+status 1 if any of those modules was imported, so that the script can
+serve as a regression check.
+
+Usage:
+    python benchmarks/bench_import_time.py [N_RUNS] [STATEMENT]
+'''
+
+import os
+import subprocess
+import sys
+
+from pathlib import Path
+
+SRC_DIR = Path(__file__).parent.parent / 'src'
+
+# Modules that `from argle import Parser` should not import.
+UNWANTED = (
+    'argparse',
+    'argle.bargparse',
+    'argle.grammar',
+    'argle.regex_lexer',
+    'argle.spec_parser',
+    'argle.tokens',
+)
+
+def main(args):
+    n = int(args[0]) if args else 5
+    stmt = args[1] if len(args) > 1 else 'from argle import Parser'
+
+    # Best cumulative time (usec) per module, over the runs.
+    best = {}
+    for _ in range(n):
+        for mod, usec in import_times(stmt).items():
+            best[mod] = min(usec, best.get(mod, usec))
+
+    print(f'# {stmt}')
+    print('# Cumulative import time (usec), best of', n)
+    for mod, usec in sorted(best.items(), key = lambda kv: -kv[1]):
+        if mod.startswith('argle') or mod in UNWANTED:
+            print(f'{usec:>9} {mod}')
+
+    unwanted = [mod for mod in UNWANTED if mod in best]
+    if unwanted:
+        print('\n# Unwanted imports:', ' '.join(unwanted))
+        sys.exit(1)
+
+def import_times(stmt):
+    # Returns dict of module name => cumulative import time (usec)
+    # reported by `python -X importtime` for the statement.
+    env = dict(os.environ, PYTHONPATH = str(SRC_DIR))
+    cmd = [sys.executable, '-X', 'importtime', '-c', stmt]
+    proc = subprocess.run(cmd, env = env, capture_output = True, text = True, check = True)
+    times = {}
+    for line in proc.stderr.splitlines():
+        # Lines look like: 'import time:  self | cumulative | module'.
+        if line.startswith('import time:'):
+            fields = line.split(':', 1)[1].split('|')
+            if len(fields) == 3 and fields[1].strip().isdigit():
+                times[fields[2].strip()] = int(fields[1])
+    return times
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
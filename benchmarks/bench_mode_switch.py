@@ -0,0 +1,88 @@
+#! /usr/bin/env python
+
+'''
+Benchmark: the cost of SpecParser mode changes.
+
+The parser flips between the grammar and quoted modes for every backquote,
+and between grammar and help-text modes for every opt-spec. The mode setter
+now swaps in a precomputed TokDefTable. This script compares that with the
+old approach, which rebuilt the list of TokDefs on every change.
+
+Usage:
+    python benchmarks/bench_mode_switch.py [N_REPEATS]
+'''
+
+import sys
+
+from pathlib import Path
+from timeit import timeit
+
+from argle.constants import Pmodes
+from argle.spec_parser import SpecParser
+from argle.tokens import TokDefs
+
+SPECS_DIR = Path(__file__).parent.parent / 'tests' / 'data' / 'specs'
+
+# A quote-heavy spec: many literals and block quotes.
+QUOTE_HEAVY = '\n'.join(
+    f'v{i} : `run` `{i}` <x=`a`|`b`|`c`> [-q]'
+    for i in range(200)
+) + '\n\n' + '\n'.join(
+    f'```\nBlock quote {i}.\n```\n'
+    for i in range(200)
+)
+
+def main(args):
+    n = int(args[0]) if args else 10
+
+    # Cost of one mode change, in microseconds.
+    sp = SpecParser('')
+    modes = (Pmodes.quoted, Pmodes.grammar)
+    k = 10000
+
+    def new_switch():
+        for mode in modes:
+            sp.mode = mode
+
+    def old_switch():
+        for mode in modes:
+            sp.lexer.curr = None
+            [td for td in TokDefs.values() if mode in td.modes]
+
+    print('# Mode change (usec per change)')
+    for label, func in (('old', old_switch), ('new', new_switch)):
+        usec = timeit(func, number = k) / (k * len(modes)) * 1e6
+        print(f'{label:<6} {usec:.3f}')
+
+    # Mode changes per spec, and the parse time they cost before the change.
+    print('\n# Specs: mode changes, old mode-change cost, parse time (msec)')
+    old_usec = timeit(old_switch, number = k) / (k * len(modes)) * 1e6
+    specs = [(p.stem, p.read_text()) for p in sorted(SPECS_DIR.glob('*.txt'))]
+    specs.append(('quote-heavy', QUOTE_HEAVY))
+    for name, text in specs:
+        nswitch = count_mode_changes(text)
+        secs = timeit(lambda: SpecParser(text).parse(), number = n) / n
+        old_msec = nswitch * old_usec / 1000
+        print(f'{name:<14} {nswitch:>6} {old_msec:>9.3f} {secs * 1000:>9.3f}')
+
+def count_mode_changes(text):
+    # Parses the spec, counting the mode changes.
+    sp = CountingSpecParser(text)
+    sp.parse()
+    return sp.nswitch
+
+class CountingSpecParser(SpecParser):
+
+    nswitch = 0
+
+    @property
+    def mode(self):
+        return self._mode
+
+    @mode.setter
+    def mode(self, mode):
+        SpecParser.mode.fset(self, mode)
+        self.nswitch += 1
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,78 @@
+#! /usr/bin/env python
+
+'''
+Benchmark: no-config parsing of large argument vectors.
+
+Compares Parser.parse_noconfig() with the previous implementation (kept
+below as old_parse_noconfig), which ran up to three regex searches per arg
+and collapsed the value lists in a second pass. The argv lists resemble
+those built by xargs: mostly positionals, with some options mixed in.
+
+Usage:
+    python benchmarks/bench_noconfig.py [N_REPEATS]
+'''
+
+import random
+import sys
+
+from collections import OrderedDict
+from timeit import timeit
+
+from argle import Parser
+from argle.constants import RGXS
+
+SIZES = (10 ** 5, 10 ** 6)
+
+def main(args):
+    n = int(args[0]) if args else 3
+    p = Parser()
+    print('# Args, old msec, new msec, speedup')
+    for label, make_argv in (('files', files_argv), ('mixed', mixed_argv)):
+        for size in SIZES:
+            argv = make_argv(size)
+            assert list(p.parse(argv)) == list(old_parse_noconfig(argv).items())
+            old = timeit(lambda: old_parse_noconfig(argv), number = n) / n
+            new = timeit(lambda: p.parse(argv), number = n) / n
+            print(f'{label:<6} {size:>8} {old * 1000:>9.1f} {new * 1000:>9.1f} {old / new:>6.1f}x')
+
+def files_argv(size):
+    # A few options, then many file paths.
+    opts = ['-v', '--max-depth', '3', '--']
+    return opts + [f'dir{i % 97}/file_{i}.txt' for i in range(size - len(opts))]
+
+def mixed_argv(size):
+    # Options, negative numbers, and values interleaved.
+    rng = random.Random(1)
+    pool = (
+        ['-x', '-y', '--name', '--long-opt', '--', '-1', '-']
+        + [f'val{i}' for i in range(20)]
+    )
+    return rng.choices(pool, k = size)
+
+def old_parse_noconfig(args):
+    # The previous implementation.
+    options = OrderedDict()
+    pos_key = 'positionals'
+    dest = pos_key
+    for arg in args:
+        if arg == '--':
+            dest = pos_key
+            continue
+        if not RGXS.negative_num.search(arg):
+            m = RGXS.short_option.search(arg) or RGXS.long_option.search(arg)
+            if m:
+                dest = m.group(1).replace('-', '_')
+                options.setdefault(dest, [])
+                continue
+        options.setdefault(dest, []).append(arg)
+    for dest, vals in options.items():
+        n = len(vals)
+        options[dest] = (
+            True if n == 0 else
+            vals[0] if n == 1 else
+            vals
+        )
+    return options
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,252 @@
+#! /usr/bin/env python
+
+'''
+Benchmark suite: spec parsing, phase by phase, on scaled corpora.
+
+For each spec in tests/data/specs, plus one from spec_gen.py (synthetic),
+and for versions of each scaled up by repeating its variants and its
+sections (eg, 10x, 100x, 1000x), this script times the phases of
+SpecParser separately:
+
+    lex        | Re-lexing every Token the parser asked for (one per memo
+               | entry), without the parser: regex matching and Tokens.
+    parse      | SpecParser(text) and parsing to a SpecAST. This includes
+               | the lexing, which is interleaved with parsing.
+    convert    | SpecAST to Grammar and Sections, before normalization.
+    normalize  | Grammar.normalize_quantifiers() and drop_degenerate_groups().
+
+Each time is the best of N runs, in msec. Results can be written as JSON,
+with the git commit and Python version, and compared with an earlier file
+to spot regressions.
+
+Usage:
+    python benchmarks/bench_spec_suite.py [--scales 1,10,100] [--specs NAMES]
+        [--repeat N] [--json PATH] [--compare PATH]
+
+The 1000x scale is supported (--scales 1,10,100,1000) but takes minutes.
+'''
+
+import json
+import platform
+import subprocess
+import sys
+
+from datetime import datetime, timezone
+from pathlib import Path
+from time import perf_counter
+
+from argle import bargparse as bp
+from argle.regex_lexer import RegexLexer
+from argle.spec_parser import SpecParser, Variant
+from argle.tokens import TokDefTables
+from argle.version import __version__
+from spec_gen import SpecShape, generate
+
+SPECS_DIR = Path(__file__).parent.parent / 'tests' / 'data' / 'specs'
+
+PHASES = ('lex', 'parse', 'convert', 'normalize')
+
+####
+# Command-line arguments.
+####
+
+ARG_CONFIGS = (
+    dict(
+        name = '--scales',
+        default = '1,10,100',
+        help = 'Comma-delimited scale factors [default: 1,10,100]',
+    ),
+    dict(
+        name = '--specs',
+        default = None,
+        help = 'Comma-delimited spec names [default: all]',
+    ),
+    dict(
+        name = '--repeat',
+        type = int,
+        default = 3,
+        help = 'Runs per measurement; the best is kept [default: 3]',
+    ),
+    dict(
+        name = '--json',
+        metavar = 'PATH',
+        help = 'Write the results as JSON to PATH',
+    ),
+    dict(
+        name = '--compare',
+        metavar = 'PATH',
+        help = 'Compare with the results in a JSON file from an earlier run',
+    ),
+    dict(
+        add_help = True,
+    ),
+)
+
+####
+# Main.
+####
+
+def main(args):
+    ap, opts = bp.parse_args(args, ARG_CONFIGS, description = __doc__)
+    scales = [int(x) for x in opts.scales.split(',')]
+    names = opts.specs.split(',') if opts.specs else None
+
+    # Run.
+    results = []
+    print_row('spec', 'scale', 'chars', 'variants', *PHASES)
+    for name, text in load_specs(names):
+        for scale in scales:
+            big = scaled_spec(text, scale)
+            r = time_phases(big, opts.repeat)
+            r.update(spec = name, scale = scale)
+            results.append(r)
+            print_row(name, scale, r['chars'], r['variants'], *(r[p] for p in PHASES))
+
+    # Write and compare.
+    data = dict(meta = metadata(opts.repeat), results = results)
+    if opts.json:
+        Path(opts.json).write_text(json.dumps(data, indent = 2) + '\n')
+    if opts.compare:
+        compare(json.loads(Path(opts.compare).read_text()), data)
+
+def load_specs(names):
+    paths = sorted(SPECS_DIR.glob('*.txt'))
+    specs = [(p.stem, p.read_text()) for p in paths]
+    specs.append(('synthetic', generate(SpecShape())))
+    return [
+        (name, text)
+        for name, text in specs
+        if names is None or name in names
+    ]
+
+####
+# Scaling and timing.
+####
+
+def scaled_spec(text, scale):
+    # Returns a spec holding the variants of the text, repeated scale
+    # times, followed by the rest of the spec (its sections and
+    # opt-specs), also repeated scale times.
+    if scale == 1:
+        return text
+    sp = SpecParser(text)
+    sp.parse_some(sp.variant)
+    split = sp.lexer.pos
+    head, tail = text[:split], text[split:]
+    head = head.rstrip('\n') + '\n' if head else head
+    return head * scale + '\n' + tail * scale
+
+def time_phases(text, repeat):
+    # Returns a dict of phase => msec (best of the repeats), plus info.
+    best = dict.fromkeys(PHASES, float('inf'))
+    for _ in range(repeat):
+        # Parse.
+        t0 = perf_counter()
+        sp = ASTParser(text)
+        sp.parse()
+        t1 = perf_counter()
+        ast = sp.ast
+
+        # Convert.
+        variants = [e for e in ast.elems if isinstance(e, Variant)]
+        others = [e for e in ast.elems if not isinstance(e, Variant)]
+        t2 = perf_counter()
+        g = sp.variants_to_grammar(variants, normalize = False)
+        sp.elems_to_sections(others)
+        t3 = perf_counter()
+
+        # Normalize.
+        g.normalize_quantifiers()
+        g.drop_degenerate_groups()
+        t4 = perf_counter()
+
+        # Lex.
+        lex_secs = relex_time(sp)
+
+        secs = dict(lex = lex_secs, parse = t1 - t0, convert = t3 - t2, normalize = t4 - t3)
+        for p, x in secs.items():
+            best[p] = min(best[p], x * 1000)
+
+    return dict(
+        chars = len(text),
+        variants = len(g.variants),
+        tokens = len(sp.lexer.memo),
+        **{p : round(x, 3) for p, x in best.items()},
+    )
+
+def relex_time(sp):
+    # Re-lexes each Token in the parser's memo, from the same position,
+    # mode, and indent-related state. Returns the elapsed seconds.
+    lex = RegexLexer(sp.lexer.text, lambda tok: True)
+    entries = list(sp.lexer.memo.items())
+    t0 = perf_counter()
+    for (pos, mode), ((indent, is_first), _) in entries:
+        lex.table = TokDefTables[mode]
+        lex.pos = pos
+        lex.indent = indent
+        lex.is_first = is_first
+        lex.lex_token()
+    return perf_counter() - t0
+
+class ASTParser(SpecParser):
+    # Stops after parsing, keeping the SpecAST.
+
+    ast = None
+
+    def ast_to_parsed_spec(self, ast):
+        self.ast = ast
+        return None
+
+####
+# Reporting.
+####
+
+def print_row(*xs):
+    fmt = '{:<14} {:>6} {:>9} {:>8}' + ' {:>10}' * len(PHASES)
+    xs = [f'{x:.2f}' if isinstance(x, float) else x for x in xs]
+    print(fmt.format(*xs))
+
+def metadata(repeat):
+    return dict(
+        commit = git_commit(),
+        argle_version = __version__,
+        python = platform.python_version(),
+        platform = platform.platform(),
+        timestamp = datetime.now(timezone.utc).isoformat(timespec = 'seconds'),
+        repeat = repeat,
+        units = 'msec',
+    )
+
+def git_commit():
+    try:
+        cp = subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            capture_output = True,
+            text = True,
+            cwd = Path(__file__).parent,
+        )
+        return cp.stdout.strip() or None
+    except OSError:
+        return None
+
+def compare(old, new):
+    # Prints the ratio new/old for each phase of each (spec, scale)
+    # present in both runs. Ratios above 1 are slowdowns.
+    prev = {
+        (r['spec'], r['scale']) : r
+        for r in old['results']
+    }
+    commits = (old['meta'].get('commit'), new['meta'].get('commit'))
+    print(f'\n# Ratios: {commits[1]} / {commits[0]}')
+    print_row('spec', 'scale', '', '', *PHASES)
+    for r in new['results']:
+        o = prev.get((r['spec'], r['scale']))
+        if o:
+            ratios = [
+                r[p] / o[p] if o[p] else float('nan')
+                for p in PHASES
+            ]
+            print_row(r['spec'], r['scale'], '', '', *ratios)
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
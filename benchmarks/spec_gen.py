@@ -0,0 +1,237 @@
+#! /usr/bin/env python
+
+'''
+Generator of large, valid Argle specs, for stress testing.
+
+SpecShape holds the knobs; generate() returns the spec text and check()
+runs it through SpecParser, confirming that the Grammar has the expected
+variants. The knobs:
+
+    variants       | Number of (non-partial) variants.
+    elems          | Top-level elems per variant.
+    partials       | Number of chains of partial-variants (name!). Each
+                   | variant uses one chain.
+    partial_depth  | Length of each chain: each partial uses the next.
+    nesting        | Maximum depth of nested groups, some with alternatives.
+    quant_density  | Fraction of positionals and groups given a quantifier
+                   | ({m}, {m-n}, or ...).
+    sections       | Number of sections (title ::).
+    headings       | Headings (:::) per section, each with opt-specs.
+    quotes         | Block quotes per section.
+    opt_specs      | Opt-spec lines (with help text) per heading.
+    seed           | Random seed: the same shape yields the same spec.
+
+Usage:
+    # Print a spec.
+    python benchmarks/spec_gen.py [--variants N] [--nesting N] ...
+
+    # Check it, or time parsing as one knob doubles (to spot
+    # superlinear behavior: msec per 1000 chars should stay flat).
+    python benchmarks/spec_gen.py --check ...
+    python benchmarks/spec_gen.py --sweep nesting=1,2,4,8 ...
+'''
+
+import random
+import sys
+
+from dataclasses import dataclass, fields, replace
+from time import perf_counter
+
+from argle import bargparse as bp
+from argle.spec_parser import SpecParser
+
+####
+# Generating specs.
+####
+
+@dataclass
+class SpecShape:
+    variants: int = 10
+    elems: int = 6
+    partials: int = 2
+    partial_depth: int = 2
+    nesting: int = 2
+    quant_density: float = 0.2
+    sections: int = 2
+    headings: int = 2
+    quotes: int = 1
+    opt_specs: int = 5
+    seed: int = 0
+
+class SpecGen:
+
+    def __init__(self, shape):
+        self.shape = shape
+        self.rng = random.Random(shape.seed)
+        self.n = 0
+
+    def generate(self):
+        shape = self.shape
+        lines = []
+
+        # Partial-variants, in chains: each uses the next one.
+        for c in range(shape.partials):
+            for d in range(shape.partial_depth):
+                elems = self.elems(max(1, shape.elems // 2), shape.nesting)
+                if d + 1 < shape.partial_depth:
+                    elems.append(partial_name(c, d + 1))
+                lines.append(f'part{c}x{d}! : ' + ' '.join(elems))
+
+        # Variants: a command literal, elems, and a partial chain.
+        for i in range(shape.variants):
+            elems = [f'<command=cmd{i}>'] + self.elems(shape.elems, shape.nesting)
+            if shape.partials and shape.partial_depth:
+                elems.append(partial_name(i % shape.partials, 0))
+            lines.append(f'v{i} : ' + ' '.join(elems))
+
+        # Sections, with block quotes and headings holding opt-specs.
+        for s in range(shape.sections):
+            lines.extend(['', f'Section {s} ::', ''])
+            for q in range(shape.quotes):
+                lines.extend([
+                    '```',
+                    f'Block quote {q} of section {s}. Blah blah blah.',
+                    'Blah blah, blah blah.',
+                    '```',
+                    '',
+                ])
+            for h in range(shape.headings):
+                lines.append(f'Heading {s}.{h} :::')
+                for _ in range(shape.opt_specs):
+                    lines.append(f'    {self.opt_spec()} : Help text for it. Blah blah.')
+                lines.append('')
+
+        return '\n'.join(lines) + '\n'
+
+    def elems(self, n, depth):
+        return [self.elem(depth) for _ in range(n)]
+
+    def elem(self, depth):
+        # Returns the text of one random variant elem.
+        rng = self.rng
+        kind = rng.choice(('pos', 'pos', 'opt', 'opt', 'lit', 'group'))
+        if kind == 'group' and depth > 0:
+            return self.group(depth)
+        elif kind == 'opt':
+            return f'[{self.option()}]'
+        elif kind == 'lit':
+            return f'`lit{self.next()}`'
+        else:
+            k = self.next()
+            if rng.random() < 0.2:
+                return self.quantified(f'<p{k}=a{k}|b{k}|c{k}>')
+            else:
+                return self.quantified(f'<p{k}>')
+
+    def group(self, depth):
+        # A group of 1-3 elems, or of alternatives.
+        rng = self.rng
+        name = f'g{self.next()}=' if rng.random() < 0.2 else ''
+        if rng.random() < 0.3:
+            alts = [
+                ' '.join(self.elems(rng.randint(1, 2), depth - 1))
+                for _ in range(rng.randint(2, 3))
+            ]
+            guts = ' | '.join(alts)
+        else:
+            guts = ' '.join(self.elems(rng.randint(1, 3), depth - 1))
+        opening, closing = rng.choice((('(', ')'), ('[', ']')))
+        return self.quantified(f'{name}{opening}{guts}{closing}')
+
+    def option(self):
+        k = self.next()
+        if self.rng.random() < 0.5:
+            return f'--opt{k}'
+        else:
+            return f'--opt{k} <v{k}>'
+
+    def opt_spec(self):
+        k = self.next()
+        return self.rng.choice((
+            f'<p{k}>',
+            f'--opt{k} <v{k}>',
+            f'[--opt{k}]',
+        ))
+
+    def quantified(self, text):
+        rng = self.rng
+        if rng.random() >= self.shape.quant_density:
+            return text
+        m = rng.randint(1, 3)
+        return text + rng.choice(('...', f'{{{m}}}', f'{{{m}-{m + 2}}}'))
+
+    def next(self):
+        self.n += 1
+        return self.n
+
+def partial_name(c, d):
+    return f'part{c}x{d}!'
+
+def generate(shape = None, **kws):
+    # Convenience function: returns the spec text for a SpecShape.
+    return SpecGen(shape or SpecShape(**kws)).generate()
+
+def check(text, shape):
+    # Parses the spec and checks its Grammar. Returns the SpecParser.
+    sp = SpecParser(text)
+    pspec = sp.parse()
+    g = sp.ast_to_grammar(pspec.grammar)
+    n = len(g.variants)
+    if n != shape.variants:
+        raise ValueError(f'Expected {shape.variants} variants, got {n}')
+    return sp
+
+####
+# Command-line usage.
+####
+
+KNOBS = {f.name : f.type for f in fields(SpecShape)}
+
+ARG_CONFIGS = tuple(
+    dict(
+        name = '--' + name.replace('_', '-'),
+        type = typ,
+        default = getattr(SpecShape, name),
+        help = f'[default: {getattr(SpecShape, name)}]',
+    )
+    for name, typ in KNOBS.items()
+) + (
+    dict(
+        name = '--check',
+        action = 'store_true',
+        help = 'Parse the spec and report, rather than print it',
+    ),
+    dict(
+        name = '--sweep',
+        metavar = 'KNOB=V1,V2,...',
+        help = 'Time parsing for each value of one knob',
+    ),
+    dict(
+        add_help = True,
+    ),
+)
+
+def main(args):
+    ap, opts = bp.parse_args(args, ARG_CONFIGS, description = __doc__)
+    shape = SpecShape(**{k : getattr(opts, k) for k in KNOBS})
+
+    if opts.sweep:
+        knob, _, vals = opts.sweep.partition('=')
+        shapes = [replace(shape, **{knob : KNOBS[knob](v)}) for v in vals.split(',')]
+    elif opts.check:
+        shapes = [shape]
+    else:
+        print(generate(shape), end = '')
+        return
+
+    print(f'{"shape":<24} {"chars":>9} {"msec":>10} {"per 1K chars":>13}')
+    for s in shapes:
+        text = generate(s)
+        t0 = perf_counter()
+        check(text, s)
+        msec = (perf_counter() - t0) * 1000
+        label = opts.sweep.partition('=')[0] + f'={getattr(s, knob)}' if opts.sweep else 'spec'
+        print(f'{label:<24} {len(text):>9} {msec:>10.1f} {msec / len(text) * 1000:>13.2f}')
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -80,6 +80,12 @@ package_data = {
     package_name: [],
 }
 
+entry_points = {
+    'console_scripts': [
+        'argle-compile = argle.spec_compiler:main',
+    ],
+}
+
 ####
 # Install.
 ####
@@ -95,6 +101,7 @@ setup(
     packages = packages,
     package_dir = {'': src_subdir},
     package_data = package_data,
+    entry_points = entry_points,
     install_requires = reqs,
     tests_require = extras['test'],
     extras_require = extras,
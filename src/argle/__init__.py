@@ -1,5 +1,37 @@
-from .parser import Parser, Result
+import sys
+
 from .version import __version__
 
-from . import bargparse
+####
+# Lazy imports (PEP 562).
+#
+# Attributes of the package are imported on first access, so that
+# a no-config script doing `from argle import Parser` does not pay
+# for argparse (bargparse) or the spec-parsing machinery.
+####
+
+# Attribute name => (module name, attribute name or None for the module).
+LAZY_ATTRS = {
+    'Parser': ('parser', 'Parser'),
+    'Result': ('parser', 'Result'),
+    'CompactResult': ('parser', 'CompactResult'),
+    'bargparse': ('bargparse', None),
+}
+
+def __getattr__(name):
+    try:
+        mod_name, attr = LAZY_ATTRS[name]
+    except KeyError:
+        raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+    # The builtin __import__ rather than importlib.import_module(),
+    # because only the former is reported by `python -X importtime`.
+    full_name = f'{__name__}.{mod_name}'
+    __import__(full_name)
+    mod = sys.modules[full_name]
+    val = mod if attr is None else getattr(mod, attr)
+    globals()[name] = val
+    return val
+
+def __dir__():
+    return sorted(set(globals()) | set(LAZY_ATTRS))
 
@@ -0,0 +1,694 @@
+r'''
+
+Parsing argv against a Grammar.
+
+ArgvEngine compiles a normalized Grammar (see SpecParser.ast_to_grammar) into
+dispatch tables, one VariantTable per Variant:
+
+    options      | Dict: option string or alias (eg, --foo, -f) => OptSlot.
+    positionals  | For flat variants, the PosSlot instances in grammar order.
+    dests        | The dests of the variant, in grammar order.
+
+It also compiles the positional skeletons of all variants into one NFA, and
+determinizes it where feasible (see nfa.py), once the engine has been used
+enough to repay the cost. Ambiguities -- positional args accepted by more
+than one variant -- are found on demand, from the DFA or else from the NFA,
+and are available as ArgvEngine.ambiguities (or raised, with strict=True).
+
+Parsing is a single pass over the args. Each option arg is found with one
+dict lookup; the option then binds its parameters greedily. The other args
+are collected and run through the DFA (or the NFA), which yields every
+variant that accepts them at once. Those variants (restricted to the ones
+defining the options used) are then finished in order: options are checked
+and the positional args are allocated to the slots. Flat variants allocate
+in one pass, using the minimum number of args still needed by the later
+slots. Other variants (repeated Groups, Alternatives) use a Pike VM over
+the NFA.
+
+The variants are also indexed by their anchors: the fixed texts (subcommand
+words, from Literals or Positionals like <command=clone>) that their first
+positional must be. The first positional arg thus selects the candidate
+variants, which limits the work when the NFA is simulated (no DFA) or when
+the variants are parsed one by one.
+
+When no variant parses, the candidates are parsed separately, to report the
+error from the variant that got furthest through the args.
+
+'''
+
+####
+# Imports.
+####
+
+import re
+
+from dataclasses import dataclass, field
+from functools import cached_property
+
+from . import grammar as GE
+from .errors import ArgvParseError, ErrKinds, ErrMsgs
+from .nfa import DFA, NFA, make_slot
+
+####
+# Constants.
+####
+
+# Args that look like options but are treated as positionals.
+NEGATIVE_NUM = re.compile(r'-\d+(\.\d+)?')
+
+# The marker that ends option processing.
+OPTIONS_END = '--'
+
+# Number of matches after which match() builds and uses the DFA.
+DFA_MIN_MATCHES = 8
+
+####
+# Data classes: the dispatch tables.
+####
+
+@dataclass
+class OptSlot:
+    # An Option in a VariantTable.
+    elem: GE.Option
+    dest: str
+
+    # Bounds on the number of parameters per occurrence (n None: unbounded).
+    m: int
+    n: int
+
+    # Whether the option is required, and the most times it can occur.
+    required: bool
+    max_times: int
+
+    # The AltChoice branches enclosing the option, outermost first,
+    # as (CHOICE_INDEX, BRANCH_INDEX) pairs: see VariantTable.alt_choices.
+    alts: tuple = ()
+
+@dataclass
+class AltChoice:
+    # A non-repeated choice among Alternatives holding options: at most
+    # one branch can be used. If required, one must be: ie, the choice is
+    # not optional, and every branch needs an option and no positionals.
+    # Parent is the enclosing (CHOICE_INDEX, BRANCH_INDEX), if any: the
+    # choice is only required when that branch is used.
+    parent: tuple
+    required: bool
+    options: list = field(default_factory = list)
+
+@dataclass
+class VariantTable:
+    name: str
+    options: dict = field(default_factory = dict)
+    positionals: list = field(default_factory = list)
+    dests: list = field(default_factory = list)
+
+    # The minimum number of positional args needed by the slots at
+    # index i and later. Set by ArgvEngine.compile_variant().
+    min_needed: list = field(default_factory = list)
+
+    # Whether the positionals can be allocated in one pass (see
+    # greedy_allocatable). If not, they are matched via the NFA,
+    # starting from the start state.
+    flat: bool = True
+    start: int = None
+    pos_slots: list = field(default_factory = list)
+
+    # The positional dests, each mapped to (PLURAL, DEFAULT): whether any
+    # slot for the dest gets a list, and the default of the first slot.
+    pos_dests: dict = field(default_factory = dict)
+
+    # The choices among Alternatives holding options: AltChoice instances.
+    alt_choices: list = field(default_factory = list)
+
+@dataclass
+class AnchorIndex:
+    # Maps each anchor text (eg, a subcommand word from a Literal or a
+    # <command=clone> Positional) to the indexes of the variants that can
+    # start with it. Unanchored variants, whose first positional is not
+    # restricted to fixed texts, are candidates for any first positional.
+    anchored: dict = field(default_factory = dict)
+    unanchored: list = field(default_factory = list)
+
+    def candidates(self, arg):
+        # The indexes of the variants that can parse args whose
+        # first positional is arg (None: no positionals).
+        return self.anchored.get(arg, self.unanchored)
+
+####
+# ArgvEngine.
+####
+
+class ArgvEngine:
+
+    def __init__(self, grammar, strict = False):
+        # A Grammar without variants (eg, from a spec holding only
+        # opt-specs) is compiled as one empty variant, which accepts
+        # only empty args, so that parse() always has a variant to try.
+        self.grammar = grammar
+        self.nfa = NFA()
+        variants = grammar.variants or [GE.Variant(name = None, elems = [])]
+        self.tables = [
+            self.compile_variant(v)
+            for v in variants
+        ]
+        self.nfa.finish()
+
+        # The DFA and the ambiguities are built on demand: see the dfa
+        # and ambiguities properties, and match().
+        self.n_matches = 0
+        if strict and self.ambiguities:
+            names, example = self.ambiguities[0]
+            raise ArgvParseError(
+                msg = ErrMsgs.ambiguous_grammar,
+                error_kind = ErrKinds.ambiguous_grammar,
+                variants = names,
+                example = example,
+            )
+
+        # A table of all option strings, for a single scan of the args,
+        # and the variants that can start with each anchor text.
+        self.union_options = self.compile_union_options()
+        self.anchors = self.compile_anchors()
+
+    @classmethod
+    def from_spec(cls, text, strict = False, spec_cache = None):
+        # Convenience constructor: parses the spec into a Grammar. With a
+        # SpecCache (or True, for one using the default directory), the
+        # Grammar comes from the cache when possible.
+        if spec_cache:
+            from .spec_cache import SpecCache
+            sc = SpecCache() if spec_cache is True else spec_cache
+            return cls(sc.grammar(text), strict = strict)
+        else:
+            from .spec_parser import SpecParser
+            sp = SpecParser(text)
+            return cls(sp.ast_to_grammar(sp.parse().grammar), strict = strict)
+
+    ####
+    # Compiling the Grammar.
+    ####
+
+    def compile_variant(self, variant):
+        vt = VariantTable(name = variant.name)
+        self.compile_elems(vt, variant.elems, True, False, ())
+
+        # The positional skeleton goes into the NFA. Flat variants
+        # also get their list of slots for one-pass allocation.
+        vt.start, vt.pos_slots = self.nfa.add_variant(variant)
+        slots = flat_slots(variant.elems)
+        if slots is not None and not greedy_allocatable(slots):
+            slots = None
+        vt.flat = slots is not None
+        vt.positionals = slots or []
+
+        # Dests, in grammar order.
+        for e in variant.walk(GE.Positional, GE.Option):
+            add_dest(vt, e.dest)
+        for slot in reversed(vt.pos_slots):
+            if slot.dest:
+                plural, default = vt.pos_dests.get(slot.dest, (False, slot.default))
+                vt.pos_dests[slot.dest] = (plural or slot.plural, default)
+
+        # Suffix sums of the minimum args needed by the positional slots.
+        needed = [0]
+        for slot in reversed(vt.positionals):
+            needed.append(needed[-1] + (slot.m if slot.required else 0))
+        vt.min_needed = needed[::-1]
+        return vt
+
+    def compile_elems(self, vt, elems, required, repeated, alts):
+        # Adds the options in the elems of a Variant or Group. If the elems
+        # are Alternatives (and not repeated), their options are recorded
+        # as belonging to the branches of a new AltChoice.
+        if elems and not repeated and all(isinstance(e, GE.Alternative) for e in elems):
+            ci = len(vt.alt_choices)
+            ac = AltChoice(
+                parent = alts[-1] if alts else None,
+                required = required and all(
+                    not has_positionals(a) and needs_option(a.elems)
+                    for a in elems
+                ),
+            )
+            vt.alt_choices.append(ac)
+            for bi, a in enumerate(elems):
+                n = len(vt.options)
+                for c in a.elems:
+                    self.compile_elem(vt, c, False, repeated, alts + ((ci, bi),))
+                ac.options.extend(list(vt.options)[n:n + 1])
+        else:
+            for e in elems:
+                self.compile_elem(vt, e, required, repeated, alts)
+
+    def compile_elem(self, vt, e, required, repeated, alts = ()):
+        # Adds the options in the elem to the VariantTable. Required is
+        # false if the elem is inside an optional Group or Alternative.
+        # Repeated is true if inside a repeated Group. Alts are the
+        # enclosing AltChoice branches.
+        if isinstance(e, GE.Option):
+            q = e.ntimes
+            m, n = param_bounds(e.parameters)
+            slot = OptSlot(
+                elem = e,
+                dest = e.dest,
+                m = m,
+                n = n,
+                required = required and q.required,
+                max_times = None if repeated else q.n,
+                alts = alts,
+            )
+            for x in [e] + e.aliases:
+                vt.options.setdefault(option_string(x), slot)
+
+        elif isinstance(e, GE.Group):
+            q = e.ntimes
+            self.compile_elems(vt, e.elems, required and q.required, repeated or q.n != 1, alts)
+
+        elif isinstance(e, GE.Alternative):
+            for c in e.elems:
+                self.compile_elem(vt, c, False, repeated, alts)
+
+        elif not isinstance(e, (GE.Positional, GE.Literal)):
+            raise ArgvParseError(
+                msg = ErrMsgs.unsupported_grammar,
+                error_kind = ErrKinds.unsupported_grammar,
+                variant = vt.name,
+                elem = type(e).__name__,
+            )
+
+    def compile_union_options(self):
+        # Returns a dict of option string => OptSlot covering all variants,
+        # or None if the variants disagree on how many parameters an
+        # option string takes (then the args must be scanned per variant).
+        options = {}
+        for vt in self.tables:
+            for opt, slot in vt.options.items():
+                other = options.setdefault(opt, slot)
+                if (other.m, other.n) != (slot.m, slot.n):
+                    return None
+        return options
+
+    def compile_anchors(self):
+        # Returns an AnchorIndex. The lists for the anchor texts are
+        # merged with the unanchored variants, in variant order.
+        anchors = AnchorIndex()
+        leads = [self.nfa.lead_texts(start) for start in self.nfa.starts]
+        for vi, texts in enumerate(leads):
+            if texts is None:
+                anchors.unanchored.append(vi)
+        for vi, texts in enumerate(leads):
+            for text in texts or ():
+                vis = anchors.anchored.setdefault(text, list(anchors.unanchored))
+                vis.append(vi)
+        for vis in anchors.anchored.values():
+            vis.sort()
+        return anchors
+
+    def variant_names(self, indexes):
+        return tuple(
+            i if self.tables[i].name is None else self.tables[i].name
+            for i in indexes
+        )
+
+    ####
+    # Parsing args.
+    ####
+
+    def parse(self, args):
+        # Returns a Result for the first variant that parses the args.
+        from .parser import Result
+        args = list(args)
+
+        # Scan the args once, match the positionals against all variants
+        # at once, and finish the matching variants in order.
+        if self.union_options is not None:
+            try:
+                pos_args, occs, index = self.scan(self.union_options, None, args)
+            except ArgvParseError:
+                pass
+            else:
+                lead = pos_args[0] if pos_args else None
+                matched = self.match(pos_args, self.anchors.candidates(lead))
+                for vi in sorted(matched):
+                    vt = self.tables[vi]
+                    if all(opt in vt.options for opt, _ in occs):
+                        try:
+                            values = self.finish_variant(vt, pos_args, occs, index, accepted = True)
+                            return Result(values)
+                        except ArgvParseError:
+                            pass
+
+        # Otherwise, parse each variant in turn, and raise the error
+        # from the variant that got furthest through the args. If the
+        # first arg is positional, only its candidate variants are tried
+        # (unless there are none, so that the error is still reported).
+        tables = self.tables
+        if args and not is_option_like(args[0]):
+            tables = [tables[vi] for vi in self.anchors.candidates(args[0])] or tables
+        err = None
+        for vt in tables:
+            try:
+                return Result(self.parse_variant(vt, args))
+            except ArgvParseError as e:
+                if err is None or e.params['index'] > err.params['index']:
+                    err = e
+        raise err
+
+    def match(self, pos_args, candidates):
+        # Returns the indexes of the variants accepting the positional args.
+        # The DFA checks all variants at once, but building it costs more
+        # than many NFA simulations, so it is used only once built already
+        # or once the engine has matched DFA_MIN_MATCHES times. When
+        # simulating the NFA, only the candidate variants are started.
+        self.n_matches += 1
+        if 'dfa' in self.__dict__ or self.n_matches > DFA_MIN_MATCHES:
+            dfa = self.dfa
+            if dfa:
+                return dfa.match(pos_args)
+        starts = self.nfa.starts
+        return self.nfa.match(pos_args, [starts[vi] for vi in candidates])
+
+    @cached_property
+    def dfa(self):
+        # The DFA, or None if infeasible.
+        return DFA.build(self.nfa)
+
+    @cached_property
+    def ambiguities(self):
+        # The ambiguities, as (VARIANTS, EXAMPLE) with the variants as names
+        # (or indexes, if unnamed). From the DFA if feasible, else from the
+        # NFA, one pair of variants at a time.
+        dfa = self.dfa
+        return [
+            (self.variant_names(a.variants), a.example)
+            for a in (dfa.ambiguities if dfa else self.nfa.ambiguities())
+        ]
+
+    def parse_variant(self, vt, args):
+        # Returns a dict of dest => value for the args, or raises.
+        pos_args, occs, index = self.scan(vt.options, vt, args)
+        return self.finish_variant(vt, pos_args, occs, index)
+
+    def scan(self, options, vt, args):
+        # Scans the args, using the options dict to find option args.
+        # Returns (POS_ARGS, OCCS, INDEX): the positional args, a list
+        # of (OPTION_STRING, PARAMS) for the option args, and the index
+        # reached (ie, len(args)).
+
+        # Setup.
+        occs = []
+        pos_args = []
+        n_args = len(args)
+        i = 0
+
+        # Scan the args.
+        while i < n_args:
+            arg = args[i]
+            i += 1
+
+            # Positionals: anything not starting with a hyphen, a lone
+            # hyphen, negative numbers, and everything after --.
+            if arg[:1] != '-' or arg == '-':
+                pos_args.append(arg)
+                continue
+            elif arg == OPTIONS_END:
+                pos_args.extend(args[i:])
+                i = n_args
+                break
+
+            # Options: look up the arg (or the part before = in --foo=x).
+            opt = arg
+            slot = options.get(arg)
+            params = []
+            if slot is None and '=' in arg:
+                opt, _, val = arg.partition('=')
+                slot = options.get(opt)
+                params.append(val)
+            if slot is None:
+                if NEGATIVE_NUM.fullmatch(arg):
+                    pos_args.append(arg)
+                    continue
+                else:
+                    self.error(ErrKinds.unknown_option, vt, i, arg = arg)
+
+            # Bind parameters greedily: args up to the option's limit,
+            # halting at the next option-like arg.
+            if slot.n is not None and len(params) > slot.n:
+                self.error(ErrKinds.unexpected_param, vt, i, option = arg)
+            limit = n_args if slot.n is None else min(n_args, i + slot.n - len(params))
+            while i < limit and not is_option_like(args[i]):
+                params.append(args[i])
+                i += 1
+            if len(params) < slot.m:
+                self.error(ErrKinds.missing_params, vt, i, option = arg, params = params)
+            occs.append((opt, params))
+
+        return (pos_args, occs, i)
+
+    def finish_variant(self, vt, pos_args, occs, index, accepted = False):
+        # Takes the results of scan(). Returns a dict of dest => value
+        # for the variant, or raises. Accepted is true if the variant is
+        # known to accept the positional args (eg, via the DFA).
+        options = vt.options
+
+        # Group the occurrences by dest.
+        occurrences = {}              # Dest => list of param lists.
+        for opt, params in occs:
+            slot = options[opt]
+            occ = occurrences.setdefault(slot.dest, [])
+            if slot.max_times is not None and len(occ) >= slot.max_times:
+                self.error(ErrKinds.too_many_occurrences, vt, index, option = opt)
+            occ.append(params)
+
+        # Check for missing options.
+        for opt, slot in options.items():
+            if slot.required and slot.dest not in occurrences:
+                self.error(ErrKinds.missing_option, vt, index, option = opt)
+
+        # Check the choices among Alternatives: at most one branch each,
+        # and one branch if required (and its parent branch was used).
+        if vt.alt_choices:
+            used = {}                 # Choice index => {branch index: opt}.
+            for opt, _ in occs:
+                for ci, bi in options[opt].alts:
+                    used.setdefault(ci, {}).setdefault(bi, opt)
+            for ci, ac in enumerate(vt.alt_choices):
+                branches = used.get(ci, {})
+                if len(branches) > 1:
+                    opts = list(branches.values())
+                    self.error(ErrKinds.conflicting_options, vt, index, options = opts)
+                elif not branches and ac.required:
+                    if ac.parent is None or ac.parent[1] in used.get(ac.parent[0], ()):
+                        self.error(ErrKinds.missing_alternative, vt, index, options = ac.options)
+
+        # Build the values, starting with every dest of the variant.
+        values = {dest : None for dest in vt.dests}
+        seen = set()
+        for slot in options.values():
+            if slot.dest in occurrences and slot.dest not in seen:
+                seen.add(slot.dest)
+                vals = [option_value(slot, ps) for ps in occurrences[slot.dest]]
+                values[slot.dest] = vals[0] if slot.max_times == 1 else vals
+        if vt.flat:
+            # If the one-pass allocation rejects positionals that the
+            # variant accepts, it got them wrong: use the Pike VM.
+            try:
+                values.update(self.allocate_positionals(vt, pos_args, index))
+            except ArgvParseError:
+                if not accepted:
+                    raise
+                values.update(self.match_positionals(vt, pos_args, index))
+        else:
+            values.update(self.match_positionals(vt, pos_args, index))
+        return values
+
+    def allocate_positionals(self, vt, pos_args, index):
+        # Assigns the positional args to the PosSlot instances, left to
+        # right. Each slot takes as many args as it can (up to its n),
+        # while leaving enough for the required slots after it. Returns a
+        # dict of dest => value. Errors report index plus the number of
+        # positionals allocated, so that parse() favors the variant that
+        # got furthest.
+        values = {}
+        n_pos = len(pos_args)
+        j = 0
+        for k, slot in enumerate(vt.positionals):
+            # How many args the slot can take.
+            avail = n_pos - j - vt.min_needed[k + 1]
+            take = avail if slot.n is None else min(avail, slot.n)
+
+            # A slot with choices stops at the first invalid arg.
+            if slot.choices:
+                for x in range(take):
+                    if pos_args[j + x] not in slot.choices:
+                        take = x
+                        break
+
+            # Too few args: an error if required, otherwise take none.
+            if take < slot.m:
+                if slot.required:
+                    if j + take < n_pos and slot.choices:
+                        kind = ErrKinds.invalid_choice
+                    else:
+                        kind = ErrKinds.missing_positional
+                    self.error(kind, vt, index + j, dest = slot.dest, choices = slot.choices)
+                take = 0
+
+            # Store.
+            if slot.dest:
+                xs = pos_args[j : j + take]
+                if slot.n == 1:
+                    values[slot.dest] = xs[0] if xs else slot.default
+                else:
+                    values[slot.dest] = xs or slot.default
+            j += take
+
+        if j < n_pos:
+            self.error(ErrKinds.unexpected_positional, vt, index + j, arg = pos_args[j])
+        return values
+
+    def match_positionals(self, vt, pos_args, index):
+        # Assigns the positional args to the PosSlot instances via the
+        # NFA, for variants that cannot be allocated in one pass. Returns
+        # a dict of dest => value, and raises like allocate_positionals().
+        slots, failure = self.nfa.pike(vt.start, pos_args)
+        if failure:
+            j, expected = failure
+            if j < len(pos_args):
+                slot = next((s for s in expected if s.choices), None)
+                if slot:
+                    self.error(ErrKinds.invalid_choice, vt, index + j, dest = slot.dest, choices = slot.choices)
+                else:
+                    self.error(ErrKinds.unexpected_positional, vt, index + j, arg = pos_args[j])
+            else:
+                dest = expected[0].dest if expected else None
+                self.error(ErrKinds.missing_positional, vt, index + j, dest = dest, choices = None)
+
+        # Collect the args for each dest.
+        got = {}
+        for arg, slot in zip(pos_args, slots):
+            if slot.dest:
+                got.setdefault(slot.dest, []).append(arg)
+
+        values = {}
+        for dest, (plural, default) in vt.pos_dests.items():
+            xs = got.get(dest)
+            if xs:
+                values[dest] = xs if plural else xs[0]
+            else:
+                values[dest] = default
+        return values
+
+    def error(self, error_kind, vt, index, **kws):
+        # Raises an ArgvParseError. The index (how far parsing got through
+        # the args) lets parse() report the most relevant failure.
+        raise ArgvParseError(
+            msg = ErrMsgs[error_kind],
+            error_kind = error_kind,
+            variant = vt.name if vt else None,
+            index = index,
+            **kws,
+        )
+
+####
+# Helpers.
+####
+
+def option_string(e):
+    # Takes an Option or Alias. Option names in the Grammar lack their
+    # hyphens, which are kept as the prefix. Grammars built without
+    # prefixes get the usual ones.
+    prefix = e.prefix or ('-' if len(e.name) == 1 else '--')
+    return prefix + e.name
+
+def is_option_like(arg):
+    return (
+        arg[:1] == '-' and
+        arg != '-' and
+        not NEGATIVE_NUM.fullmatch(arg)
+    )
+
+def option_value(slot, params):
+    # The value for one occurrence of an option.
+    if slot.n == 0:
+        return True
+    elif slot.n == 1:
+        return params[0] if params else True
+    else:
+        return params
+
+def param_bounds(elems, required = True):
+    # Takes the parameters of an Option (Parameter or Group).
+    # Returns (M, N): bounds on the total number of args they take.
+    m = 0
+    n = 0
+    for e in elems:
+        if isinstance(e, GE.Parameter):
+            q = e.nargs
+            em, en = (q.m, q.n)
+            req = q.required
+        else:
+            q = e.ntimes
+            em, en = param_bounds(e.elems)
+            if en is not None and q.n is not None:
+                em, en = (em * q.m, en * q.n)
+            else:
+                em, en = (em * q.m, None)
+            req = q.required
+        if required and req:
+            m += em
+        n = None if n is None or en is None else n + en
+    return (m, n)
+
+def flat_slots(elems, required = True):
+    # Takes the elems of a Variant or Group. Returns their PosSlot instances
+    # in order, or None if allocate_positionals() cannot handle them: ie,
+    # if they hold Alternatives or repeated Groups with positionals.
+    slots = []
+    for e in elems:
+        if isinstance(e, (GE.Positional, GE.Literal)):
+            slots.append(make_slot(e, required = required))
+        elif isinstance(e, GE.Alternative):
+            if has_positionals(e):
+                return None
+        elif isinstance(e, GE.Group):
+            q = e.ntimes
+            sub = flat_slots(e.elems, required and q.required)
+            if sub is None or (sub and q.n != 1):
+                return None
+            slots.extend(sub)
+    return slots
+
+def greedy_allocatable(slots):
+    # Whether allocate_positionals() accepts the same args as the NFA.
+    # Once a slot can take a variable number of args, a later slot with
+    # choices, or an optional one needing 2+ args, might need some of the
+    # args taken by the greedy slot: those variants use the Pike VM.
+    variable = False
+    for slot in slots:
+        if variable and (slot.choices or (slot.m > 1 and not slot.required)):
+            return False
+        if slot.n != slot.m or not slot.required:
+            variable = True
+    return True
+
+def needs_option(elems):
+    # Whether the elems cannot be satisfied without some option.
+    for e in elems:
+        if isinstance(e, GE.Option):
+            if e.ntimes.required:
+                return True
+        elif isinstance(e, GE.Group) and e.ntimes.required:
+            es = e.elems
+            if es and all(isinstance(a, GE.Alternative) for a in es):
+                if all(needs_option(a.elems) for a in es):
+                    return True
+            elif needs_option(es):
+                return True
+    return False
+
+def has_positionals(e):
+    return any(True for _ in e.walk(GE.Positional, GE.Literal))
+
+def add_dest(vt, dest):
+    if dest not in vt.dests:
+        vt.dests.append(dest)
@@ -15,6 +15,21 @@ ErrMsgs = cons(
     choice_sep_last = 'Choice separator (|) cannot be last element in variant or group',
     quant_range_ordering = 'Invalid quantifier-range {m-n}: n cannot be less than m',
     quant_range_empty = 'Invalid quantifier-range {m-n}: n cannot be 0',
+    undefined_partial = 'Partial-variant is used but not defined',
+    partial_cycle = 'Partial-variant uses itself, directly or indirectly',
+    # Argv parsing.
+    unsupported_grammar = 'Grammar element not supported by the argv engine',
+    ambiguous_grammar = 'Grammar variants accept the same positional args',
+    unknown_option = 'Unrecognized option',
+    missing_params = 'Too few parameters for option',
+    unexpected_param = 'Option does not take a parameter',
+    too_many_occurrences = 'Option given too many times',
+    missing_option = 'Missing required option',
+    conflicting_options = 'Options from different alternatives cannot be combined',
+    missing_alternative = 'Missing an option from the required alternatives',
+    missing_positional = 'Missing required positional',
+    invalid_choice = 'Invalid choice for positional',
+    unexpected_positional = 'Unexpected positional',
 )
 
 ErrKinds = constants(ErrMsgs.keys())
@@ -29,3 +44,6 @@ class SpecParseError(ArgleError):
     def __str__(self):
         return super().__str__() + self.parse_context
 
+class ArgvParseError(ArgleError):
+    pass
+
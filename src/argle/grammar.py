@@ -12,9 +12,8 @@ from short_con import cons, constants
 
 from .constants import Chars, Pmodes
 from .errors import SpecParseError, ErrKinds, ErrMsgs
-from .regex_lexer import RegexLexer
-from .tokens import Token, TokDefs
-from .utils import get, distilled, is_subclass
+from .tokens import Token
+from .utils import get, distilled, instance_attrs, is_subclass
 
 ####
 # Data classes: TreeElem and WalkElem.
@@ -37,6 +36,9 @@ class WalkElem:
 
 class TreeElem:
 
+    # No instance dict here, so that subclasses can be slotted.
+    __slots__ = ()
+
     WALKABLE = []
 
     def traverse(self, *wanted_types, level = 0, attr = None, structured = False):
@@ -50,78 +52,82 @@ class TreeElem:
         #   list end, and elem end. For this use case, the logic to compute level
         #   for recursive calls is different.
         #
-        # - attr: relevent only for some recursive calls.
+        # - level, attr: for the WalkElem of self.
         #
         # This method can be used reliably in contexts where the parent TreeElem
         # is modified by the caller during traversal. This works because none
         # of the parent's WALKABLE attributes holding children are checked until
         # after the WalkElem for self has already been yielded and mutated.
         #
+        # The traversal uses an explicit stack of pending steps, rather than
+        # recursive generators. Each step is (LEVEL, KIND, ATTR, VAL). Callers
+        # that need only the elems should use walk(), which is cheaper.
+        #
 
         # Setup.
         wanted_types = wanted_types or (TreeElem,)
         WEK = WalkElemKinds
-
-        # Helper to calculate level, either for a WalkElem or a recursive call.
-        def calc_level(d1, d2):
-            return level + (d2 if structured else (d1 or 0))
-
-        # Helpers to yield a WalkElem conditionally.
-        def elem_yielder(**kws):
-            if isinstance(kws.get('val'), wanted_types):
-                yield WalkElem(**kws)
-
-        def structure_yielder(**kws):
-            if structured:
-                yield WalkElem(**kws)
-
-        # A WalkElem for self.
-        yield from elem_yielder(
-            level = calc_level(0, 0),
-            kind = WEK.elem,
-            attr = attr,
-            val = self,
-        )
-
-        # Process its WALKABLE attributes.
-        for attr in self.WALKABLE:
-            children = getattr(self, attr, None)
-            if isinstance(children, list):
-                # If the WALKABLE attribute holds a list of chidren:
-                # - Yield WalkElem for list open.
-                # - Yield from a recursive call of each child.
-                # - Yield WalkElem for list close.
-                yield from structure_yielder(
-                    level = calc_level(None, 1),
-                    kind = WEK.list_open,
-                    attr = attr,
-                )
-                for c in children:
-                    yield from c.traverse(
-                        *wanted_types,
-                        level = calc_level(1, 2),
-                        structured = structured,
+        ELEM = WEK.elem
+
+        # Level increments for children, depending on structured.
+        d_list, d_child, d_single = (1, 2, 1) if structured else (0, 1, 1)
+
+        stack = [(level, ELEM, attr, self)]
+        pop = stack.pop
+        while stack:
+            lev, kind, attr, val = pop()
+
+            # Structural steps.
+            if kind is not ELEM:
+                yield WalkElem(level = lev, kind = kind, attr = attr)
+                continue
+
+            # A WalkElem for the elem.
+            if isinstance(val, wanted_types):
+                yield WalkElem(level = lev, kind = ELEM, attr = attr, val = val)
+
+            # Then its WALKABLE attributes: steps are gathered in
+            # order and pushed in reverse, so they pop in order.
+            steps = []
+            for a in walkable_attrs(type(val)):
+                children = getattr(val, a, None)
+                if isinstance(children, list):
+                    # A list of children: list open, each child, list close.
+                    if structured:
+                        steps.append((lev + d_list, WEK.list_open, a, None))
+                    steps.extend(
+                        (lev + d_child, ELEM, None, c)
+                        for c in children
                     )
-                yield from structure_yielder(
-                    level = calc_level(None, 1),
-                    kind = WEK.list_close,
-                )
-            elif children is not None:
-                # If the WALKABLE attributes hold a single child,
-                # yield from a recursive call on it.
-                c = children
-                yield from c.traverse(
-                    *wanted_types,
-                    level = calc_level(1, 1),
-                    attr = attr,
-                    structured = structured,
-                )
-
-        # Yield WalkElem for list close.
-        yield from structure_yielder(
-            level = calc_level(None, 0),
-            kind = WEK.elem_close,
-        )
+                    if structured:
+                        steps.append((lev + d_list, WEK.list_close, None, None))
+                elif children is not None:
+                    # A single child.
+                    steps.append((lev + d_single, ELEM, a, children))
+            if structured:
+                steps.append((lev, WEK.elem_close, None, None))
+            stack.extend(reversed(steps))
+
+    def walk(self, *wanted_types):
+        # Yields self and all of its TreeElem descendants, in DFS-order, or
+        # just those of the wanted types. Like traverse(), but without the
+        # WalkElem wrappers, levels, or structure. Children are read after
+        # their parent is yielded, so the caller can replace them.
+        wanted_types = wanted_types or (TreeElem,)
+        stack = [self]
+        pop = stack.pop
+        while stack:
+            e = pop()
+            if isinstance(e, wanted_types):
+                yield e
+            kids = []
+            for a in walkable_attrs(type(e)):
+                children = getattr(e, a, None)
+                if isinstance(children, list):
+                    kids.extend(children)
+                elif children is not None:
+                    kids.append(children)
+            stack.extend(reversed(kids))
 
     def pretty(self, indent_size = 4, omit_closing = False):
         # Return a pretty-printable blob of text to represent
@@ -147,7 +153,7 @@ class TreeElem:
                 lines.append(f'{level_indent}{attr_eq}{cls_name}(')
 
                 # One line per non-WALKABLE attribute.
-                for a, val in elem.__dict__.items():
+                for a, val in instance_attrs(elem).items():
                     if a not in elem.WALKABLE:
                         if isinstance(val, Token):
                             val_str = val.brief
@@ -169,15 +175,32 @@ class TreeElem:
         # Return as text.
         return Chars.newline.join(lines)
 
+# The WALKABLE attributes that each TreeElem class actually has.
+WALKABLE_ATTRS = {}
+
+def walkable_attrs(cls):
+    attrs = WALKABLE_ATTRS.get(cls)
+    if attrs is None:
+        fields = getattr(cls, '__dataclass_fields__', {})
+        attrs = tuple(
+            a
+            for a in cls.WALKABLE
+            if a in fields or hasattr(cls, a)
+        )
+        WALKABLE_ATTRS[cls] = attrs
+    return attrs
+
 ####
 # Data classes: GrammarElem.
 ####
 
 VariantElem = Union['Opt', 'Group', 'Alternative']
 
-@dataclass
 class GrammarElem(TreeElem):
 
+    # Not a dataclass itself, so that subclasses can be frozen.
+    __slots__ = ()
+
     WALKABLE = [
         'variants',
         'elems',
@@ -254,8 +277,8 @@ class Grammar(GrammarElem):
     variants: list['Variant']
 
     def normalize_quantifiers(self):
-        for we in self.traverse():
-            we.val.qnormalize()
+        for e in self.walk():
+            e.qnormalize()
 
     def drop_degenerate_groups(self):
         # Removes all degenerate-groups in the Grammar.
@@ -265,8 +288,7 @@ class Grammar(GrammarElem):
         # of the group), without unneeded Group(s) wrapping it. If no, the
         # method returns the same elem, unchanged.
         #
-        for we in self.traverse(Variant, Group, Alternative, Option):
-            e = we.val
+        for e in self.walk(Variant, Group, Alternative, Option):
             old_elems = getattr(e, e.elems_attr)
             new_elems = [c.without_degen_group() for c in old_elems]
             setattr(e, e.elems_attr, new_elems)
@@ -331,6 +353,9 @@ class Option(Opt):
     priority: bool = False
     negaters: list['Option'] = None
 
+    # The dashes before the name in the spec (eg, - or --).
+    prefix: str = None
+
     # TODO: implement derived behavior.
 
     @property
@@ -344,6 +369,7 @@ class Option(Opt):
 @dataclass
 class Alias(GrammarElem):
     name: str
+    prefix: str = None
 
 @dataclass
 class Literal(Opt):
@@ -364,12 +390,34 @@ class Parameter(VarInput):
     convert: callable = None
     validate: callable = None
 
-@dataclass
+# Interned Quantifier instances, keyed by (m, n, required, greedy).
+QUANTIFIERS = {}
+
+@dataclass(frozen = True, init = False)
 class Quantifier(GrammarElem):
+    # Immutable and interned: Quantifier(...) returns the existing instance
+    # for the same attributes, so the few common shapes ({1,1}, optional,
+    # ...) are shared across a Grammar. To derive another, construct a new
+    # Quantifier with the changed attributes.
+    __slots__ = ('m', 'n', 'required', 'greedy')
     m: int
-    n: int = None
-    required: bool = True
-    greedy: bool = True
+    n: int
+    required: bool
+    greedy: bool
+
+    def __new__(cls, m, n = None, required = True, greedy = True):
+        key = (m, n, required, greedy)
+        q = QUANTIFIERS.get(key)
+        if q is None:
+            q = object.__new__(cls)
+            for attr, val in zip(cls.__slots__, key):
+                object.__setattr__(q, attr, val)
+            QUANTIFIERS[key] = q
+        return q
+
+    def __reduce__(self):
+        # Pickling and copying go through __new__, and thus the cache.
+        return (Quantifier, (self.m, self.n, self.required, self.greedy))
 
     @classmethod
     def normalized(cls, q):
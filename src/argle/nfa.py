@@ -0,0 +1,485 @@
+r'''
+
+An NFA and DFA over the positional skeletons of Grammar variants.
+
+The argv engine handles options by dict dispatch (see engine.py). What
+remains of a variant once its options are set aside is a regular language
+over the positional args:
+
+    Positional, Literal   | A symbol: one arg (restricted to its choices).
+    Quantifier            | Repetition, greedy or not.
+    Alternative           | Alternation.
+    Optional Group        | Optional.
+
+NFA compiles the variants into one Thompson-style NFA whose start state
+branches to each variant, and whose match states record the variant index.
+It can simulate the NFA for all variants at once, or run a Pike VM for one
+variant to learn which PosSlot each arg was assigned to.
+
+DFA determinizes the NFA by subset construction, where feasible (the
+number of DFA states is capped). Its input classes are the choice texts
+used anywhere in the grammar plus one class for every other arg, so
+matching all variants costs one dict lookup per arg. A DFA state holding
+match states for several variants means that some positional args are
+accepted by all of them: those ambiguities are found while building the
+DFA and reported via DFA.ambiguities. When the DFA is infeasible,
+NFA.ambiguities() finds them for each pair of variants instead.
+
+'''
+
+####
+# Imports.
+####
+
+from dataclasses import dataclass
+
+from . import grammar as GE
+
+####
+# Constants.
+####
+
+# NFA state kinds.
+SLOT = 0        # Consumes one arg accepted by a PosSlot.
+SPLIT = 1       # Epsilon transitions, in priority order.
+MATCH = 2       # Accepts for a variant.
+
+# Limit on the number of DFA states before we fall back to the NFA.
+MAX_DFA_STATES = 1000
+
+# How to show the input class for args other than choices
+# in the examples of an Ambiguity.
+OTHER_ARG = '<arg>'
+
+####
+# Data classes.
+####
+
+@dataclass
+class PosSlot:
+    # A Positional (or Literal, with dest None) in a variant.
+    dest: str
+    m: int
+    n: int
+    required: bool
+    choices: frozenset = None
+    default: object = None
+
+    # Whether the dest gets a list: true if the Positional can take
+    # several args or is inside a repeated Group.
+    plural: bool = False
+
+    def accepts(self, arg):
+        return self.choices is None or arg in self.choices
+
+@dataclass
+class Ambiguity:
+    # Variants (indexes) that accept the same positional args, and
+    # a shortest example of such args.
+    variants: tuple
+    example: list
+
+def make_slot(e, required = True, plural = False):
+    # Takes a Positional or Literal. Returns a PosSlot.
+    if isinstance(e, GE.Literal):
+        return PosSlot(
+            dest = None,
+            m = 1,
+            n = 1,
+            required = required,
+            choices = frozenset([e.text]),
+        )
+    else:
+        q = e.nargs
+        return PosSlot(
+            dest = e.dest,
+            m = q.m,
+            n = q.n,
+            required = required and q.required,
+            choices = frozenset(c.text for c in e.choices) or None,
+            default = e.default,
+            plural = plural or q.n != 1,
+        )
+
+def common_arg(x, y):
+    # Takes two PosSlots. Returns an arg accepted by both (OTHER_ARG
+    # standing for any non-choice arg), or None if there are none.
+    if x.choices is None and y.choices is None:
+        return OTHER_ARG
+    elif x.choices is None:
+        choices = y.choices
+    elif y.choices is None:
+        choices = x.choices
+    else:
+        choices = x.choices & y.choices
+    return min(choices) if choices else None
+
+####
+# NFA.
+####
+
+class NFA:
+
+    def __init__(self):
+        # States are indexes into these lists:
+        # - kinds: SLOT, SPLIT, or MATCH.
+        # - targets: next state (SLOT), list of states (SPLIT), or
+        #   variant index (MATCH).
+        # - slots: the PosSlot (SLOT) or None.
+        self.kinds = []
+        self.targets = []
+        self.slots = []
+
+        # The start state of each variant, and the overall start.
+        self.starts = []
+        self.start = None
+
+    def add(self, kind, target, slot = None):
+        self.kinds.append(kind)
+        self.targets.append(target)
+        self.slots.append(slot)
+        return len(self.kinds) - 1
+
+    ####
+    # Building.
+    #
+    # The build functions work right to left: each takes the state to
+    # continue with after the elem (nxt) and returns the elem's start.
+    ####
+
+    def add_variant(self, variant):
+        # Adds a Variant. Returns its start state and its PosSlots.
+        vi = len(self.starts)
+        new_slots = []
+        accept = self.add(MATCH, vi)
+        start = self.build_seq(variant.elems, accept, False, new_slots)
+        self.starts.append(start)
+        return (start, new_slots)
+
+    def finish(self):
+        # Adds the overall start state, once the variants are added.
+        self.start = self.add(SPLIT, list(self.starts))
+
+    def build_seq(self, elems, nxt, plural, new_slots):
+        # A sequence of elems, or an alternation if they are Alternatives.
+        if elems and all(isinstance(e, GE.Alternative) for e in elems):
+            return self.add(SPLIT, [
+                self.build_seq(a.elems, nxt, plural, new_slots)
+                for a in elems
+            ])
+        for e in reversed(elems):
+            nxt = self.build_elem(e, nxt, plural, new_slots)
+        return nxt
+
+    def build_elem(self, e, nxt, plural, new_slots):
+        if isinstance(e, (GE.Positional, GE.Literal)):
+            slot = make_slot(e, plural = plural)
+            new_slots.append(slot)
+            build = lambda k: self.add(SLOT, k, slot)
+            q = getattr(e, 'nargs', None)
+        elif isinstance(e, GE.Group):
+            q = e.ntimes
+            p = plural or q.n != 1
+            build = lambda k: self.build_seq(e.elems, k, p, new_slots)
+        elif isinstance(e, GE.Alternative):
+            return self.build_seq(e.elems, nxt, plural, new_slots)
+        else:
+            # Options are not part of the positional skeleton.
+            return nxt
+        return self.repeat(build, q, nxt)
+
+    def repeat(self, build, q, nxt):
+        # Takes a function to build one instance of an elem (given its
+        # continuation), a Quantifier, and the continuation. Unrolls the
+        # required instances and then the optional ones (or a loop).
+        def either(body, rest):
+            targets = [body, rest] if greedy else [rest, body]
+            return self.add(SPLIT, targets)
+
+        greedy = q.greedy if q else True
+        m, n = (q.m, q.n) if q else (1, 1)
+        if n is None:
+            loop = self.add(SPLIT, [])
+            body = build(loop)
+            self.targets[loop] = [body, nxt] if greedy else [nxt, body]
+            k = loop
+        else:
+            k = nxt
+            for _ in range(n - m):
+                k = either(build(k), nxt)
+        for _ in range(m):
+            k = build(k)
+        if q and not q.required:
+            k = either(k, nxt)
+        return k
+
+    ####
+    # Simulation.
+    ####
+
+    def closure(self, states):
+        # Returns the frozenset of SLOT and MATCH states
+        # reachable from the states via epsilon transitions.
+        kinds = self.kinds
+        targets = self.targets
+        seen = set()
+        result = set()
+        stack = list(states)
+        while stack:
+            s = stack.pop()
+            if s in seen:
+                continue
+            seen.add(s)
+            if kinds[s] == SPLIT:
+                stack.extend(targets[s])
+            else:
+                result.add(s)
+        return frozenset(result)
+
+    def step(self, states, accepts):
+        # The closure of the states reached from SLOT states
+        # for which accepts(slot) is true.
+        kinds = self.kinds
+        targets = self.targets
+        slots = self.slots
+        return self.closure(
+            targets[s]
+            for s in states
+            if kinds[s] == SLOT and accepts(slots[s])
+        )
+
+    def match(self, args, starts = None):
+        # Simulates the NFA for all variants at once (or for those with
+        # the given start states). Returns the frozenset of variant
+        # indexes accepting the args.
+        states = self.closure([self.start] if starts is None else starts)
+        for arg in args:
+            states = self.step(states, lambda slot: slot.accepts(arg))
+            if not states:
+                break
+        return self.accepted(states)
+
+    def lead_texts(self, start):
+        # Returns the frozenset of texts that the first positional arg
+        # must be, starting from the start state. Or None if the first
+        # arg can be anything (or the args can be empty).
+        texts = set()
+        for s in self.closure([start]):
+            slot = self.slots[s]
+            if slot is None or slot.choices is None:
+                return None
+            texts.update(slot.choices)
+        return frozenset(texts)
+
+    def accepted(self, states):
+        return frozenset(
+            self.targets[s]
+            for s in states
+            if self.kinds[s] == MATCH
+        )
+
+    def pike(self, start, args):
+        # Runs a Pike VM from the start state: threads are kept in priority
+        # order and a state is taken by the first thread to reach it, so the
+        # result is the same as a backtracking matcher that prefers greedy
+        # repetition, but in one pass over the args.
+        #
+        # Returns (SLOTS, None) where SLOTS has the PosSlot for each arg.
+        # Or (None, (J, SLOTS)) if the args do not match: J is the index
+        # of the first arg that could not be consumed (or len(args)) and
+        # SLOTS are the PosSlots that were expected there.
+        kinds = self.kinds
+        targets = self.targets
+        slots = self.slots
+        clist = self.add_threads([], set(), start, None)
+        for j, arg in enumerate(args):
+            nlist = []
+            seen = set()
+            for s, path in clist:
+                if kinds[s] == SLOT and slots[s].accepts(arg):
+                    self.add_threads(nlist, seen, targets[s], (slots[s], path))
+            if not nlist:
+                return (None, (j, self.expected(clist)))
+            clist = nlist
+
+        for s, path in clist:
+            if kinds[s] == MATCH:
+                # Unwind the path, a linked list of (SLOT, PREV).
+                result = []
+                while path:
+                    slot, path = path
+                    result.append(slot)
+                result.reverse()
+                return (result, None)
+        return (None, (len(args), self.expected(clist)))
+
+    def add_threads(self, tlist, seen, s, path):
+        # Adds threads for the states reachable from s via epsilon
+        # transitions, in priority order, unless already seen.
+        kinds = self.kinds
+        targets = self.targets
+        stack = [s]
+        while stack:
+            s = stack.pop()
+            if s in seen:
+                continue
+            seen.add(s)
+            if kinds[s] == SPLIT:
+                stack.extend(reversed(targets[s]))
+            else:
+                tlist.append((s, path))
+        return tlist
+
+    ####
+    # Ambiguities.
+    ####
+
+    def ambiguities(self):
+        # Returns the Ambiguity for each pair of variants accepting some of
+        # the same positional args. Unlike DFA.build(), this works on pairs
+        # of NFA states rather than sets, so it stays cheap for grammars
+        # whose DFA would be too big.
+        starts = self.starts
+        return [
+            Ambiguity(variants = (i, j), example = example)
+            for i in range(len(starts))
+            for j in range(i + 1, len(starts))
+            for example in [self.common_example(starts[i], starts[j])]
+            if example is not None
+        ]
+
+    def common_example(self, a, b):
+        # Searches the product of the NFA from start states a and b,
+        # breadth first. Returns a shortest list of args accepted from
+        # both, or None if there are none.
+        closures = {}
+
+        def closure(s):
+            c = closures.get(s)
+            if c is None:
+                c = closures[s] = self.closure([s])
+            return c
+
+        def successors(p, q):
+            return [(p2, q2) for p2 in closure(p) for q2 in closure(q)]
+
+        kinds = self.kinds
+        targets = self.targets
+        slots = self.slots
+        parents = {pq : None for pq in successors(a, b)}
+        queue = list(parents)
+        for pq in queue:
+            p, q = pq
+            if kinds[p] == MATCH and kinds[q] == MATCH:
+                # Unwind the parents, a chain of (ARG, PREV_PAIR).
+                example = []
+                while parents[pq]:
+                    arg, pq = parents[pq]
+                    example.append(arg)
+                example.reverse()
+                return example
+            if kinds[p] == SLOT and kinds[q] == SLOT:
+                arg = common_arg(slots[p], slots[q])
+                if arg is not None:
+                    for pq2 in successors(targets[p], targets[q]):
+                        if pq2 not in parents:
+                            parents[pq2] = (arg, pq)
+                            queue.append(pq2)
+        return None
+
+    def expected(self, threads):
+        return [
+            self.slots[s]
+            for s, _ in threads
+            if self.kinds[s] == SLOT
+        ]
+
+####
+# DFA.
+####
+
+class DFA:
+
+    def __init__(self, classes, trans, accepts, ambiguities):
+        # - classes: dict of choice text => input class (other args: 0).
+        # - trans: per state, a dict of input class => next state.
+        # - accepts: per state, a frozenset of variant indexes.
+        # - ambiguities: list of Ambiguity.
+        self.classes = classes
+        self.trans = trans
+        self.accepts = accepts
+        self.ambiguities = ambiguities
+
+    @classmethod
+    def build(cls, nfa, max_states = MAX_DFA_STATES):
+        # Subset construction. Returns a DFA, or None if it would
+        # need more than max_states states.
+
+        # Input classes, and a representative arg for each.
+        texts = sorted({
+            c
+            for slot in nfa.slots
+            if slot and slot.choices
+            for c in slot.choices
+        })
+        classes = {t : i + 1 for i, t in enumerate(texts)}
+        reps = [None] + texts
+
+        def accepts_class(c):
+            if c:
+                return lambda slot: slot.accepts(reps[c])
+            else:
+                return lambda slot: slot.choices is None
+
+        # Build the states, breadth first. For each state, remember the
+        # state and input class leading to it, to build the examples.
+        start = nfa.closure([nfa.start])
+        ids = {start : 0}
+        sets = [start]
+        parents = [None]
+        trans = []
+        i = 0
+        while i < len(sets):
+            row = {}
+            for c in range(len(reps)):
+                t = nfa.step(sets[i], accepts_class(c))
+                if not t:
+                    continue
+                if t not in ids:
+                    if len(sets) >= max_states:
+                        return None
+                    ids[t] = len(sets)
+                    sets.append(t)
+                    parents.append((i, c))
+                row[c] = ids[t]
+            trans.append(row)
+            i += 1
+
+        # The variants accepted in each state, and the ambiguities: the
+        # first (thus shortest) example for each set of variants.
+        accepts = [nfa.accepted(s) for s in sets]
+        ambiguities = {}
+        for k, vis in enumerate(accepts):
+            if len(vis) > 1 and vis not in ambiguities:
+                example = []
+                while parents[k]:
+                    k, c = parents[k]
+                    example.append(reps[c] if c else OTHER_ARG)
+                example.reverse()
+                ambiguities[vis] = Ambiguity(
+                    variants = tuple(sorted(vis)),
+                    example = example,
+                )
+
+        return cls(classes, trans, accepts, list(ambiguities.values()))
+
+    def match(self, args):
+        # Returns the frozenset of variant indexes accepting the args.
+        classes = self.classes
+        trans = self.trans
+        state = 0
+        for arg in args:
+            state = trans[state].get(classes.get(arg, 0))
+            if state is None:
+                return frozenset()
+        return self.accepts[state]
@@ -1,65 +1,305 @@
+import string
 import sys
+from array import array
+from bisect import bisect_right
 from collections import OrderedDict
+from collections.abc import Sequence
 
 from .constants import MODES, RGXS
 
+ASCII_LETTERS = frozenset(string.ascii_letters)
+
 class Parser:
 
     def __init__(self,
                  spec = None,
                  grammar = None,
-                 mode = None):
+                 mode = None,
+                 compact = False,
+                 spec_cache = None):
         self.spec = spec
         self.grammar = grammar
-        self.mode = MODES.flag    # TEMP: only one mode so far.
+
+        # Opt-in cache of the spec's Grammar: a SpecCache,
+        # or True for one using the default cache directory.
+        self.spec_cache = spec_cache
+
+        # A Parser with a spec or grammar defaults to normal mode.
+        configured = spec is not None or grammar is not None
+        self.mode = mode or (MODES.normal if configured else MODES.flag)
+
+        # Whether to return a CompactResult rather than a Result.
+        self.compact = compact
+
+        # State for incremental parsing via feed() and finish().
+        self.engine = None
+        self.builder = None
+
+        # The ArgvEngine for normal mode: created on first use.
+        self.argv_engine = None
 
     def parse(self, args = None, mode = None):
+        # Args can be any iterable, including a lazy one (eg, lines
+        # streamed from a file): the no-config modes consume it one
+        # arg at a time and never materialize it as a list.
         args = sys.argv[1:] if args is None else args
-        mode = mode or self.mode
-        if mode == MODES.flag:
+        mode = self.check_mode(mode)
+        if mode == MODES.normal:
+            return self.get_argv_engine().parse(args)
+        else:
             return self.parse_noconfig(args, mode)
+
+    def get_argv_engine(self):
+        # Imported here so that no-config parsing does
+        # not pay for the spec-parsing machinery.
+        if self.argv_engine is None:
+            from .engine import ArgvEngine
+            if self.grammar is not None:
+                self.argv_engine = ArgvEngine(self.grammar)
+            else:
+                self.argv_engine = ArgvEngine.from_spec(self.spec, spec_cache = self.spec_cache)
+        return self.argv_engine
+
+    def parse_noconfig(self, args, mode):
+        # Drives the engine directly rather than via noconfig_events(),
+        # to save a generator resumption per arg.
+        #
+        # In compact mode, when the args are a sequence (rather than a
+        # stream), values are recorded as spans of the args: see ArgsView.
+        step = NoconfigEngine(mode).step
+        if self.compact and isinstance(args, Sequence):
+            builder = SpanResultBuilder(args)
+            add = builder.add
+            for i, arg in enumerate(args):
+                event = step(arg)
+                if event:
+                    add(*event, i)
+        else:
+            builder = ResultBuilder(self.compact)
+            add = builder.add
+            for arg in args:
+                event = step(arg)
+                if event:
+                    add(*event)
+        return builder.result()
+
+    def check_mode(self, mode, noconfig = False):
+        # Returns the mode to use, or raises if it is not supported.
+        # Incremental parsing passes noconfig = True.
+        mode = mode or self.mode
+        if mode in NOCONFIG_MODES:
+            return mode
+        elif mode == MODES.normal and (self.spec or self.grammar) and not noconfig:
+            return mode
         else:
             msg = 'Invalid mode: {}'.format(mode)
             raise NotImplementedError(msg)
 
-    def parse_noconfig(self, args, mode):
-        # Quick and dirty no-config arg parsing.
+    ####
+    # Incremental parsing.
+    #
+    # The events() iterator lets callers act on each option and value as
+    # soon as it is known, without storing anything. For example, a tool
+    # receiving many file paths can process the positionals in a
+    # streaming pipeline:
+    #
+    #   for dest, arg in p.events(args):
+    #       if dest == 'positionals': ...
+    #
+    # Alternatively, callers can feed() args one at a time (each call
+    # returns the resulting event, if any) and then call finish() to
+    # get the Result, as from parse().
+    ####
+
+    def events(self, args = None, mode = None):
+        args = sys.argv[1:] if args is None else args
+        mode = self.check_mode(mode, noconfig = True)
+        return noconfig_events(args, mode)
+
+    def feed(self, arg):
+        if self.engine is None:
+            self.engine = NoconfigEngine(self.check_mode(None, noconfig = True))
+            self.builder = ResultBuilder(self.compact)
+        event = self.engine.step(arg)
+        if event:
+            self.builder.add(*event)
+        return event
+
+    def finish(self):
+        # Returns the Result for the args fed so far and
+        # resets the Parser for another round of feed() calls.
+        builder = self.builder or ResultBuilder(self.compact)
+        self.engine = None
+        self.builder = None
+        return builder.result()
+
+####
+# No-config engine and Result builder.
+####
 
-        # Setup.
-        options = OrderedDict()
-        pos_key = 'positionals'       # TODO: will be configurable.
-        dest = pos_key
+# The no-config modes.
+NOCONFIG_MODES = (MODES.flag, MODES.key_val, MODES.greedy)
 
-        # Process arguments.
-        for arg in args:
+class NoconfigEngine:
+    # The engine for the no-config modes. Each step() takes one arg and
+    # returns a (DEST, ARG) tuple for an option (with ARG None) or for a
+    # value (bound to DEST). Returns None for the -- marker.
+    #
+    # How many values an option binds depends on the mode:
+    #
+    #   flag    | All values up to the next option or -- marker.
+    #   greedy  | Same as flag.
+    #   key_val | At most one value; later values are positionals.
+    #
+    # Each arg is classified with cheap prefix checks. Regexes are
+    # used only for long options and for args where the checks could
+    # disagree with RGXS: non-ASCII args (re.I lets [a-z] match a few
+    # non-ASCII letters) and args ending in a newline ($ can match
+    # before it). See option_dest().
 
-            # Switch dest back to pos_key when we see the -- marker.
+    def __init__(self, mode):
+        self.pos_key = 'positionals'  # TODO: will be configurable.
+        self.dest = self.pos_key
+        self.bind_one = mode == MODES.key_val
+
+    def step(self, arg):
+        # Set dest if the arg is an option (and not a negative number).
+        # Switch dest back to pos_key when we see the -- marker.
+        if arg[:1] == '-':
             if arg == '--':           # TODO: extract to constant.
-                dest = pos_key
-                continue
-
-            # Set dest if we see an option that is not a negative integer.
-            if not RGXS.negative_num.search(arg):
-                m = RGXS.short_option.search(arg) or RGXS.long_option.search(arg)
-                if m:
-                    dest = hyphen2under(m.group(1))
-                    options.setdefault(dest, [])
-                    continue
-
-            # Store arg under the current dest.
-            options.setdefault(dest, []).append(arg)
-
-        # Convert parameter-less options to flags.
-        for dest, vals in options.items():
-            n = len(vals)
-            options[dest] = (
-                True if n == 0 else
-                vals[0] if n == 1 else
-                vals
-            )
+                self.dest = self.pos_key
+                return None
+            elif len(arg) == 2 and arg[1] in ASCII_LETTERS:
+                d = arg[1]
+            else:
+                d = option_dest(arg)
+            if d is not None:
+                self.dest = d
+                return (d, None)
+
+        # Bind arg to the current dest.
+        dest = self.dest
+        if self.bind_one:
+            self.dest = self.pos_key
+        return (dest, arg)
+
+def noconfig_events(args, mode):
+    # Generator over the engine events for an iterable of args.
+    step = NoconfigEngine(mode).step
+    for arg in args:
+        event = step(arg)
+        if event:
+            yield event
+
+class ResultBuilder:
+    # Builds a Result from engine events. Values are stored in their
+    # final form as they arrive: True for an option with no params, a str
+    # for one value, a list for more. In compact mode, the dest keys are
+    # interned and multiple values go in a PackedStrs rather than a list.
+
+    def __init__(self, compact = False):
+        self.compact = compact
+        self.options = OrderedDict()
+        self.lists = set()            # Dests holding a list of values.
+        self.seq = PackedStrs if compact else list
 
-        # Return.
-        return Result(options)
+    def add(self, dest, arg):
+        options = self.options
+
+        # An option: register its dest.
+        if arg is None:
+            if dest not in options:
+                options[sys.intern(dest) if self.compact else dest] = True
+
+        # Store arg under the dest.
+        elif dest in self.lists:
+            options[dest].append(arg)
+        else:
+            val = options.get(dest, True)
+            if val is True:
+                if self.compact and dest not in options:
+                    dest = sys.intern(dest)
+                options[dest] = arg
+            else:
+                options[dest] = self.seq((val, arg))
+                self.lists.add(dest)
+
+    def result(self):
+        if self.compact:
+            return CompactResult(self.options)
+        else:
+            return Result(self.options)
+
+class SpanResultBuilder(ResultBuilder):
+    # Builds a CompactResult from engine events and the indexes of their
+    # args in the args sequence. Values are recorded in ArgsView
+    # instances, so memory use grows with the number of option
+    # boundaries rather than the number of args.
+    #
+    # The current run of consecutive values for the same dest is tracked
+    # as (DEST, START, STOP) and added to the dest's ArgsView when the
+    # run ends.
+
+    def __init__(self, args):
+        super().__init__(compact = True)
+        self.args = args
+        self.run_dest = None
+        self.run_start = 0
+        self.run_stop = 0
+
+    def add(self, dest, arg, i):
+        # Extend the current run.
+        if i == self.run_stop and dest == self.run_dest and arg is not None:
+            self.run_stop = i + 1
+            return
+
+        # Otherwise, register the dest.
+        if dest not in self.options:
+            self.options[sys.intern(dest)] = True
+
+        # And start a new run.
+        if arg is not None:
+            self.end_run()
+            self.run_dest = dest
+            self.run_start = i
+            self.run_stop = i + 1
+
+    def end_run(self):
+        dest = self.run_dest
+        if dest is not None:
+            options = self.options
+            val = options[dest]
+            if val is True:
+                options[dest] = ArgsView(self.args, self.run_start, self.run_stop)
+            else:
+                val.add_span(self.run_start, self.run_stop)
+            self.run_dest = None
+
+    def result(self):
+        # A dest with one value gets the arg itself, as in a Result.
+        self.end_run()
+        options = self.options
+        for dest, val in options.items():
+            if val is not True and len(val) == 1:
+                options[dest] = val[0]
+        return CompactResult(options)
+
+def option_dest(arg):
+    # Takes an arg starting with a hyphen and not handled by the fast
+    # checks in parse_noconfig(). Returns the option dest or None.
+    if arg.isascii() and arg[-1] != '\n':
+        if arg[1:2] == '-':
+            m = RGXS.long_option.search(arg)
+            return hyphen2under(m.group(1)) if m else None
+        else:
+            # A negative number, a lone hyphen, or a
+            # hyphen followed by 2+ chars: not an option.
+            return None
+    elif RGXS.negative_num.search(arg):
+        return None
+    else:
+        m = RGXS.short_option.search(arg) or RGXS.long_option.search(arg)
+        return hyphen2under(m.group(1)) if m else None
 
 def hyphen2under(s):
     return s.replace('-', '_')
@@ -83,8 +323,8 @@ class Result:
 
     def __eq__(self, other):
         return (
-            isinstance(other, Result) and
-            self.__dict__ == other.__dict__
+            isinstance(other, (Result, CompactResult)) and
+            self.__dict__ == dict(other)
         )
 
     def __repr__(self):
@@ -95,3 +335,204 @@ class Result:
     def __str__(self):
         return repr(self)
 
+####
+# Compact storage for large parses.
+####
+
+class CompactResult:
+    # A read-only Result for large parses: see Parser(compact = True).
+    # The dest keys are interned and multiple values are stored in
+    # PackedStrs instances (or ArgsView instances, when the parsed args
+    # were a sequence). The repr is computed once and truncates
+    # long sequences of values.
+    #
+    # The slots use leading underscores so that they cannot collide
+    # with dests (which start with a letter).
+
+    __slots__ = ('_options', '_repr')
+
+    def __init__(self, d):
+        self._options = d
+        self._repr = None
+
+    def __getattr__(self, k):
+        # Underscore names are never dests. Refusing them also prevents
+        # recursion when _options is unset (eg, during unpickling).
+        if k.startswith('_'):
+            raise AttributeError(k)
+        try:
+            return self._options[k]
+        except KeyError:
+            raise AttributeError(k) from None
+
+    def __reduce__(self):
+        # Pickle and copy via the dict: the cached repr is recomputed.
+        return (CompactResult, (self._options,))
+
+    def __iter__(self):
+        return iter(self._options.items())
+
+    def __getitem__(self, k):
+        return self._options[k]
+
+    def __len__(self):
+        return len(self._options)
+
+    def __contains__(self, k):
+        return k in self._options
+
+    def __eq__(self, other):
+        return (
+            isinstance(other, (Result, CompactResult)) and
+            self._options == dict(other)
+        )
+
+    __hash__ = None
+
+    def __repr__(self):
+        if self._repr is None:
+            fmt = '{}={}'
+            inside = ', '.join(
+                fmt.format(k, short_repr(v))
+                for k, v in self._options.items()
+            )
+            self._repr = 'CompactResult({})'.format(inside)
+        return self._repr
+
+    def __str__(self):
+        return repr(self)
+
+class PackedStrs(Sequence):
+    # A sequence of str stored as one UTF-8 buffer plus an array of end
+    # offsets, rather than as a list of str objects. Values are decoded
+    # to str only when accessed. The offsets are 4-byte unsigned ints
+    # until the buffer outgrows them. The surrogatepass error handler lets
+    # any str round trip, including the lone surrogates that Python uses
+    # for undecodable bytes in sys.argv.
+
+    __slots__ = ('buf', 'ends')
+
+    def __init__(self, strs = ()):
+        self.buf = bytearray()
+        self.ends = array('I')
+        self.extend(strs)
+
+    def append(self, s):
+        buf = self.buf
+        buf += s.encode('utf-8', 'surrogatepass')
+        try:
+            self.ends.append(len(buf))
+        except OverflowError:
+            self.ends = array('Q', self.ends)
+            self.ends.append(len(buf))
+
+    def extend(self, strs):
+        for s in strs:
+            self.append(s)
+
+    def __len__(self):
+        return len(self.ends)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        ends = self.ends
+        if i < 0:
+            i += len(ends)
+        if not 0 <= i < len(ends):
+            raise IndexError('PackedStrs index out of range')
+        stop = ends[i]
+        start = ends[i - 1] if i else 0
+        return self.buf[start:stop].decode('utf-8', 'surrogatepass')
+
+    def __iter__(self):
+        view = memoryview(self.buf)
+        start = 0
+        for stop in self.ends:
+            yield str(view[start:stop], 'utf-8', 'surrogatepass')
+            start = stop
+
+    def __eq__(self, other):
+        if isinstance(other, PackedStrs):
+            return self.ends == other.ends and self.buf == other.buf
+        elif isinstance(other, (list, tuple)):
+            return len(self) == len(other) and all(
+                a == b for a, b in zip(self, other)
+            )
+        else:
+            return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self):
+        return 'PackedStrs({})'.format(short_repr(self))
+
+class ArgsView(Sequence):
+    # A read-only view of some args in an args sequence, stored as spans
+    # of indexes (START, STOP) rather than as a list. Args are fetched
+    # from the underlying sequence when accessed. The spans are held in
+    # parallel arrays, with the number of args preceding each span.
+
+    __slots__ = ('args', 'starts', 'stops', 'offsets', 'n')
+
+    def __init__(self, args, start, stop):
+        self.args = args
+        self.starts = array('Q', (start,))
+        self.stops = array('Q', (stop,))
+        self.offsets = array('Q', (0,))
+        self.n = stop - start
+
+    def add_span(self, start, stop):
+        # Adds the args in args[start:stop].
+        self.starts.append(start)
+        self.stops.append(stop)
+        self.offsets.append(self.n)
+        self.n += stop - start
+
+    @property
+    def spans(self):
+        return list(zip(self.starts, self.stops))
+
+    def __len__(self):
+        return self.n
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(self.n))]
+        if i < 0:
+            i += self.n
+        if not 0 <= i < self.n:
+            raise IndexError('ArgsView index out of range')
+        k = bisect_right(self.offsets, i) - 1
+        return self.args[self.starts[k] + i - self.offsets[k]]
+
+    def __iter__(self):
+        args = self.args
+        for start, stop in zip(self.starts, self.stops):
+            for j in range(start, stop):
+                yield args[j]
+
+    def __eq__(self, other):
+        if isinstance(other, (list, tuple, PackedStrs, ArgsView)):
+            return len(self) == len(other) and all(
+                a == b for a, b in zip(self, other)
+            )
+        else:
+            return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self):
+        return 'ArgsView({})'.format(short_repr(self))
+
+def short_repr(val, limit = 10):
+    # Returns the repr of a value, but for a long list, PackedStrs, or
+    # ArgsView shows only the first few items and a count of the rest.
+    if isinstance(val, (list, PackedStrs, ArgsView)) and len(val) > limit:
+        items = ', '.join(repr(x) for x in val[:limit])
+        return '[{}, ... {} more]'.format(items, len(val) - limit)
+    elif isinstance(val, (PackedStrs, ArgsView)):
+        return repr(list(val))
+    else:
+        return repr(val)
+
@@ -0,0 +1,209 @@
+r'''
+
+Opt-in profiling of spec parsing.
+
+SpecParser(text, profile = True) binds profiled versions of its parsing
+functions (see track_parse() in spec_parser.py). They feed a ParseProfile,
+which records, per parsing function:
+
+    calls       | Number of calls.
+    cum_time    | Seconds inside the function, including its callees. For
+                | recursive functions, only the outermost call counts.
+    self_time   | Seconds inside the function, excluding its callees.
+    tokens      | Net Tokens eaten by the function, including its callees
+                | (outermost calls only): Tokens discarded by a position
+                | reset are not counted.
+    backtracks  | Position resets done by the function.
+
+It also records self time per parse-stack path, which can be written in the
+collapsed-stack format read by flame-graph tools (flamegraph.pl, speedscope,
+etc): one line per path, like "parse;variant;variant_elems 1234", where the
+count is in microseconds.
+
+Usage:
+
+    sp = SpecParser(text, profile = True)
+    sp.parse()
+    print(sp.profile.report())
+    Path('spec.folded').write_text(sp.profile.collapsed())
+
+    # Or from the command line, which also reports the RegexLexer
+    # counters: see LexerStats in regex_lexer.py.
+    python -m argle.profiling SPEC_PATH [--collapsed PATH]
+
+To aggregate over several specs, pass the same ParseProfile to each
+SpecParser via the profile parameter.
+
+'''
+
+####
+# Imports.
+####
+
+import sys
+
+from dataclasses import dataclass
+from pathlib import Path
+from textwrap import dedent
+from time import perf_counter
+
+####
+# Data classes.
+####
+
+@dataclass
+class FuncStats:
+    name: str
+    calls: int = 0
+    cum_time: float = 0.0
+    self_time: float = 0.0
+    tokens: int = 0
+    backtracks: int = 0
+
+####
+# ParseProfile.
+####
+
+class ParseProfile:
+
+    def __init__(self, clock = perf_counter):
+        self.clock = clock
+
+        # Function name => FuncStats.
+        self.stats = {}
+
+        # Parse-stack path (a tuple of function names) => self time.
+        self.stacks = {}
+
+        # One frame per active parsing-function call:
+        # [START, CHILD_TIME, N_EATEN].
+        self.frames = []
+
+        # Function name => N of active calls, to handle recursion.
+        self.active = {}
+
+    def func_stats(self, name):
+        fs = self.stats.get(name)
+        if fs is None:
+            fs = self.stats[name] = FuncStats(name)
+        return fs
+
+    ####
+    # Recording: called by the profiled parsing functions.
+    ####
+
+    def enter(self, name, n_eaten):
+        self.active[name] = self.active.get(name, 0) + 1
+        self.frames.append([self.clock(), 0.0, n_eaten])
+
+    def exit(self, name, n_eaten, parse_stack):
+        # Time for the call, and for the call minus its callees.
+        start, child_time, n_eaten_start = self.frames.pop()
+        elapsed = self.clock() - start
+        self_time = elapsed - child_time
+        if self.frames:
+            self.frames[-1][1] += elapsed
+
+        # Update the function stats. Cumulative values come only
+        # from the outermost call, to avoid double counting.
+        fs = self.func_stats(name)
+        fs.calls += 1
+        fs.self_time += self_time
+        n = self.active[name] - 1
+        self.active[name] = n
+        if n == 0:
+            fs.cum_time += elapsed
+            fs.tokens += n_eaten - n_eaten_start
+
+        # Update the stack paths.
+        path = tuple(s[:-2] for s in parse_stack)
+        self.stacks[path] = self.stacks.get(path, 0.0) + self_time
+
+    def backtrack(self, parse_stack):
+        # A position reset, charged to the current parsing function.
+        if parse_stack:
+            self.func_stats(parse_stack[-1][:-2]).backtracks += 1
+
+    ####
+    # Reporting.
+    ####
+
+    @property
+    def total_time(self):
+        return sum(self.stacks.values())
+
+    def collapsed(self):
+        # Returns the stack paths and their self times in microseconds,
+        # in the collapsed-stack format of flame-graph tools.
+        lines = [
+            ';'.join(path) + f' {round(secs * 1e6)}'
+            for path, secs in sorted(self.stacks.items())
+        ]
+        return ''.join(line + '\n' for line in lines)
+
+    def report(self, sort_by = 'self_time'):
+        # Returns a table of the function stats, sorted descending.
+        rows = sorted(
+            self.stats.values(),
+            key = lambda fs: getattr(fs, sort_by),
+            reverse = True,
+        )
+        fmt = '{:<28} {:>8} {:>10} {:>10} {:>8} {:>10}'
+        lines = [fmt.format('function', 'calls', 'cum_ms', 'self_ms', 'tokens', 'backtracks')]
+        for fs in rows:
+            lines.append(fmt.format(
+                fs.name,
+                fs.calls,
+                f'{fs.cum_time * 1000:.3f}',
+                f'{fs.self_time * 1000:.3f}',
+                fs.tokens,
+                fs.backtracks,
+            ))
+        return '\n'.join(lines)
+
+####
+# Command-line entry point.
+####
+
+DESCRIPTION = dedent('''
+    Parse an Argle spec with profiling on and report
+    the stats for each parsing function.
+''')
+
+ARG_CONFIGS = (
+    dict(
+        name = 'path',
+        metavar = 'SPEC_PATH',
+        help = 'Path to a file holding the spec',
+    ),
+    dict(
+        name = '--collapsed',
+        metavar = 'PATH',
+        help = 'Write collapsed stacks (for flame graphs) to PATH',
+    ),
+    dict(
+        name = '--sort',
+        default = 'self_time',
+        choices = ('calls', 'cum_time', 'self_time', 'tokens', 'backtracks'),
+        help = 'Report column to sort by [default: self_time]',
+    ),
+    dict(
+        add_help = True,
+    ),
+)
+
+def main(args = None):
+    from . import bargparse as bp
+    from .spec_parser import SpecParser
+    args = sys.argv[1:] if args is None else args
+    ap, opts = bp.parse_args(args, ARG_CONFIGS, description = DESCRIPTION)
+    sp = SpecParser(Path(opts.path).read_text(), profile = True)
+    sp.parse()
+    print(sp.profile.report(sort_by = opts.sort))
+    print()
+    print(sp.lexer.stats.report())
+    if opts.collapsed:
+        Path(opts.collapsed).write_text(sp.profile.collapsed())
+
+if __name__ == '__main__':
+    main()
@@ -1,12 +1,11 @@
 
 import sys
 
-from dataclasses import dataclass
-
-from short_con import cons
+from collections import Counter
+from dataclasses import dataclass, field
 
 from .constants import Chars
-from .tokens import Token, TokDefs
+from .tokens import Token, TokDefs, TokDefTables
 from .utils import get_caller_name, get
 
 ####
@@ -19,7 +18,7 @@ class RegexLexer(object):
     # Setup.
     ####
 
-    def __init__(self, text, validator, tokdefs = None, debug = False):
+    def __init__(self, text, validator, table = None, debug = False, stats = False):
         # Text to be lexed.
         self.text = text
         self.lines = text.split(Chars.newline)
@@ -28,9 +27,9 @@ class RegexLexer(object):
         self.debug_fh = debug
         self.debug_indent = 0
 
-        # TokDefs currently of interest. Modal parsers can change
-        # them when the parsing mode changes.
-        self.tokdefs = tokdefs
+        # TokDefTable holding the TokDefs currently of interest. Modal
+        # parsers can change it when the parsing mode changes.
+        self.table = table
 
         # A validation function. Called in get_next_token() to ask the parser
         # whether the matched Token is a kind of immediate of interest.
@@ -54,44 +53,59 @@ class RegexLexer(object):
         self.indent = 0
         self.is_first = True
 
+        # Packrat-style memo of emitted Tokens, keyed by (pos, mode), so that
+        # re-lexing after the parser resets the position is a dict lookup.
+        self.memo = {}
+
+        # Opt-in counters: regex attempts, matches, rejections, memo hits,
+        # etc. A LexerStats, or None. When on, lex_token() is shadowed by
+        # its tallying version, so that normal lexing pays nothing for it.
+        self.stats = None
+        if stats:
+            self.stats = LexerStats()
+            self.lex_token = self.tallied_lex_token
+
     ####
     # Properties allowing the SpecParser to change the tokdefs
     # of interest or to reset the lexer position.
     ####
 
     @property
-    def tokdefs(self):
-        return self._tokdefs
+    def table(self):
+        return self._table
 
-    @tokdefs.setter
-    def tokdefs(self, tokdefs):
-        # If TokDefs are changed, clear any cached Token.
-        self._tokdefs = tokdefs
+    @table.setter
+    def table(self, table):
+        # If the TokDefTable is changed, clear any cached Token.
+        self._table = table
         self.curr = None
 
+    @property
+    def tokdefs(self):
+        return self._table.tokdefs
+
     @property
     def position(self):
-        return cons(
-            pos = self.pos,
-            line = self.line,
-            col = self.col,
-            indent = self.indent,
-            is_first = self.is_first,
-            curr = None,
-        )
+        # A plain tuple, because the SpecParser saves a position
+        # often and restores one only when it backtracks.
+        return (self.pos, self.line, self.col, self.indent, self.is_first)
 
     @position.setter
     def position(self, pos):
-        for a, v in pos:
-            setattr(self, a, v)
+        self.pos, self.line, self.col, self.indent, self.is_first = pos
+        self.curr = None
 
     ####
     # Getting the next token.
     #
     # - get_next_token(): used by SpecParser during its parsing process.
     #
-    # - match_token(): used by RegexLexer to try the tokdefs in order
-    #   until it matches a TokDef with a token that should be emitted.
+    # - match_token(): used by RegexLexer to get the next Token, either
+    #   from the memo or by calling lex_token().
+    #
+    # - lex_token(): finds the first of the tokdefs (in order) that matches,
+    #   repeating until it matches a TokDef with a token that should be
+    #   emitted. A single call to the TokDefTable regex finds each Token.
     #
     ####
 
@@ -104,6 +118,8 @@ class RegexLexer(object):
         if self.curr:
             tok = self.curr
             self.curr = None
+            if self.stats:
+                self.stats.reserved += 1
         else:
             tok = self.match_token()
 
@@ -111,13 +127,18 @@ class RegexLexer(object):
         # whether to return it or cache it in self.curr.
         # If returned, we update location information.
         if tok:
-            self.debug(lexed = tok.kind)
+            if self.debug_fh:
+                self.debug(lexed = tok.kind)
             if self.validator(tok):
                 self.update_location(tok)
                 self.curr = None
-                self.debug(returned = tok.kind)
+                if self.debug_fh:
+                    self.debug(returned = tok.kind)
                 return tok
             else:
+                if self.stats:
+                    rej = self.stats.rejected
+                    rej[tok.kind] = rej.get(tok.kind, 0) + 1
                 self.curr = tok
                 return None
 
@@ -134,59 +155,96 @@ class RegexLexer(object):
     def match_token(self):
         # Starting at self.pos, return the next Token.
         #
-        # For non-emitted tokens, we break out of the for-loop, but enter the
-        # while-loop again. This allows the lexer to be able to ignore 0+
-        # non-emitted tokens on each call of the function.
+        # If we lexed from this position in this mode before, reuse that
+        # Token and the location info it carries. The memo entry is only
+        # valid if the indent-related info we started with is the same.
+        #
+        key = (self.pos, self.table.mode)
+        start = (self.indent, self.is_first)
+        memo = self.memo.get(key)
+        if memo and memo[0] == start:
+            if self.stats:
+                self.stats.memo_hits += 1
+            tok = memo[1]
+            self.pos = tok.pos
+            self.line = tok.line
+            self.col = tok.col
+            self.indent = tok.indent
+            self.is_first = tok.is_first
+            return tok
+        if self.stats:
+            self.stats.memo_misses += 1
+        tok = self.lex_token()
+        if tok:
+            self.memo[key] = (start, tok)
+        return tok
+
+    def lex_token(self):
+        # Used by match_token() to lex the next Token.
         #
-        tok = True
-        while tok:
-            tok = None
-            for td in self.tokdefs:
-                m = td.regex.match(self.text, pos = self.pos)
-                if m:
-                    tok = self.create_token(td, m)
-                    if td.emit:
-                        return tok
-                    else:
-                        self.update_location(tok)
-                        break
-        return None
+        # For non-emitted tokens, we update the location and try again. This
+        # allows the lexer to be able to ignore 0+ non-emitted tokens on each
+        # call of the function.
+        while True:
+            result = self.table.match(self.text, self.pos)
+            if result is None:
+                return None
+            td, groups = result
+            tok = self.create_token(td, groups)
+            if td.emit:
+                return tok
+            else:
+                self.update_location(tok)
+
+    def tallied_lex_token(self):
+        # Same as lex_token(), but each attempt is tallied by (mode, first
+        # character, kind matched): that is enough for LexerStats to know
+        # which TokDefs were tried.
+        tally = self.stats.tally
+        while True:
+            result = self.table.match(self.text, self.pos)
+            k = (
+                self.table.mode,
+                self.text[self.pos : self.pos + 1],
+                result[0].kind if result else None,
+            )
+            tally[k] = tally.get(k, 0) + 1
+            if result is None:
+                return None
+            td, groups = result
+            tok = self.create_token(td, groups)
+            if td.emit:
+                return tok
+            else:
+                self.update_location(tok)
 
     ####
     # Helpers used when getting the next token.
     ####
 
-    def create_token(self, tokdef, m = None):
-        # Helper to create Token from a TokDef and a regex Match.
-        text = m[0] if m else ''
-        newline_indexes = [
-            i for i, c in enumerate(text)
-            if c == Chars.newline
-        ]
+    def create_token(self, tokdef, groups = None):
+        # Helper to create Token from a TokDef and the captured groups.
         return Token(
             kind = tokdef.kind,
-            text = text,
-            m = m,
-            width = len(text),
+            groups = groups or ('',),
             pos = self.pos,
             line = self.line,
             col = self.col,
-            nlines = len(newline_indexes) + 1,
             is_first = self.is_first,
             indent = self.indent,
-            newlines = newline_indexes,
         )
 
     def update_location(self, tok):
         # Updates the lexer's position-related info, given that
         # the parser has accepted the Token.
 
-        # Character index, line number.
-        self.pos += tok.width
-        self.line += tok.nlines - 1
+        # Character index.
+        text = tok.text
+        width = len(text)
+        self.pos += width
 
-        # Column number.
-        if tok.newlines:
+        # Line and column number.
+        if Chars.newline in text:
             # Text straddles multiple lines. New column number
             # is based on the width of the text on the last line.
             #
@@ -200,17 +258,18 @@ class RegexLexer(object):
             #     fubb\nbar\n   | 9         | [4, 8]       | 1
             #     fubb\nbar\nxy | 11        | [4, 8]       | 3
             #
-            self.col = tok.width - tok.newlines[-1]
+            self.line += tok.nlines - 1
+            self.col = width - tok.newlines[-1]
         else:
             # Easy case: just add the token's width.
-            self.col += tok.width
+            self.col += width
 
         # Update the parser's indent-related info.
         if tok.isa(TokDefs.newline):
             self.indent = 0
             self.is_first = True
         elif tok.isa(TokDefs.indent):
-            self.indent = tok.width
+            self.indent = width
             self.is_first = True
         else:
             self.is_first = False
@@ -273,6 +332,105 @@ class RegexLexer(object):
         msg = f'{msg_prefix}{indent}{caller_name}({params})'
         print(msg, file = fh)
 
+####
+# LexerStats.
+####
+
+@dataclass
+class LexerStats:
+    # Counters kept by RegexLexer(stats = True), to help tune the TokDef
+    # order in define_tokdefs() and to measure changes to the lexer.
+    #
+    # - tally: (MODE, CHAR, KIND) => N of regex attempts in the mode, at
+    #   text starting with the character, that matched the TokDef kind
+    #   (None if nothing matched). Memo hits make no attempts.
+    # - rejected: kind => N of Tokens rejected by the validator.
+    # - reserved: N of Tokens served again from RegexLexer.curr.
+    # - memo_hits, memo_misses: see RegexLexer.match_token().
+    #
+    # The other counts are derived from the tally.
+
+    tally: dict = field(default_factory = dict)
+    rejected: dict = field(default_factory = dict)
+    reserved: int = 0
+    memo_hits: int = 0
+    memo_misses: int = 0
+
+    @property
+    def attempts(self):
+        return sum(self.tally.values())
+
+    @property
+    def failures(self):
+        return sum(n for (_, _, kind), n in self.tally.items() if kind is None)
+
+    @property
+    def matches(self):
+        # Kind => N of matches, whether emitted or not.
+        c = Counter()
+        for (_, _, kind), n in self.tally.items():
+            if kind:
+                c[kind] += n
+        return c
+
+    @property
+    def skipped(self):
+        # Kind => N of non-emitted Tokens (whitespace, etc) skipped.
+        return Counter({
+            kind : n
+            for kind, n in self.matches.items()
+            if not TokDefs[kind].emit
+        })
+
+    @property
+    def tried(self):
+        # Kind => N of attempts in which the regex engine reached the
+        # TokDef's alternative: those where it or a later one matched,
+        # or nothing did.
+        c = Counter()
+        for (mode, char, kind), n in self.tally.items():
+            kinds = TokDefTables[mode].candidates(char)
+            stop = kinds.index(kind) + 1 if kind else len(kinds)
+            for k in kinds[:stop]:
+                c[k] += n
+        return c
+
+    def hit_rates(self):
+        # Kind => fraction of the attempts trying the TokDef that matched it.
+        # TokDefs tried often but rarely hit are candidates to move later.
+        matches = self.matches
+        return {
+            kind : matches[kind] / n
+            for kind, n in self.tried.items()
+        }
+
+    def report(self):
+        # Returns the counters as text.
+        tried = self.tried
+        matches = self.matches
+        rates = self.hit_rates()
+        lines = [
+            f'attempts: {self.attempts}',
+            f'failures: {self.failures}',
+            f'alternatives tried: {sum(tried.values())}',
+            f'skipped: {sum(self.skipped.values())}',
+            f'rejected: {sum(self.rejected.values())}',
+            f'reserved: {self.reserved}',
+            f'memo hits/misses: {self.memo_hits}/{self.memo_misses}',
+            '',
+        ]
+        fmt = '{:<24} {:>8} {:>8} {:>8} {:>8}'
+        lines.append(fmt.format('kind', 'tried', 'matches', 'rate', 'rejected'))
+        for kind, n in tried.most_common():
+            lines.append(fmt.format(
+                kind,
+                n,
+                matches[kind],
+                f'{rates[kind]:.3f}',
+                self.rejected.get(kind, 0),
+            ))
+        return '\n'.join(lines)
+
 ####
 # ParseContext.
 ####
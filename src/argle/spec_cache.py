@@ -0,0 +1,161 @@
+r'''
+
+An opt-in, on-disk cache of parsed specs.
+
+Programs using Argle typically parse the same constant spec on every process
+start. A SpecCache stores the ParsedSpec returned by SpecParser.parse() and
+the normalized Grammar from SpecParser.ast_to_grammar() in pickle files,
+keyed by a hash of the spec text and the Argle version, so that later runs
+skip lexing, parsing, and the SpecAST-to-Grammar conversion.
+
+Usage:
+
+    pspec = SpecCache().parse(SPEC)
+    pspec = SpecCache('/some/dir').parse(SPEC)
+    g = SpecCache().grammar(SPEC)
+
+    # Or let the Parser use it.
+    args = Parser(spec = SPEC, spec_cache = True).parse()
+    args = Parser(spec = SPEC, spec_cache = SpecCache('/some/dir')).parse()
+
+Stale or corrupt cache files are ignored: the spec is parsed normally and the
+cache file is rewritten. Failures to write the cache are also ignored.
+
+The cache directory should be writable only by the user: loading a pickle
+file can execute code.
+
+'''
+
+####
+# Imports.
+####
+
+import hashlib
+import os
+import pickle
+import tempfile
+
+from pathlib import Path
+
+from .version import __version__
+
+####
+# Constants.
+####
+
+# Bump when the layout of cache files or the pickled classes change
+# in ways that the Argle version alone would not capture.
+CACHE_FORMAT = 3
+
+# Environment variable to override the default cache directory.
+CACHE_DIR_ENV = 'ARGLE_CACHE_DIR'
+
+# The kinds of cached objects, each in its own file, so that loading the
+# Grammar does not unpickle the ParsedSpec (and import SpecParser).
+PSPEC = 'pspec'
+GRAMMAR = 'grammar'
+CACHE_SUFFIXES = {
+    PSPEC : '.pickle',
+    GRAMMAR : '.grammar.pickle',
+}
+
+####
+# SpecCache.
+####
+
+class SpecCache:
+
+    def __init__(self, cache_dir = None):
+        self.cache_dir = Path(cache_dir or default_cache_dir())
+
+    def key(self, text):
+        # Hash of the spec text, the Argle version, and the cache format.
+        h = hashlib.sha256()
+        h.update(f'argle={__version__};format={CACHE_FORMAT};'.encode())
+        h.update(text.encode('utf-8'))
+        return h.hexdigest()
+
+    def path(self, text, kind = PSPEC):
+        return self.cache_dir / f'{self.key(text)}{CACHE_SUFFIXES[kind]}'
+
+    def header(self, text):
+        # Stored with the entry and checked when loading it.
+        return (CACHE_FORMAT, __version__, self.key(text))
+
+    def parse(self, text):
+        # Returns the ParsedSpec for the text.
+        return self.load(text, PSPEC)
+
+    def grammar(self, text):
+        # Returns the normalized Grammar for the text.
+        return self.load(text, GRAMMAR)
+
+    def load(self, text, kind):
+        # Returns the cached object of the given kind for the text, if
+        # possible. Otherwise parses the spec and caches both kinds.
+        # SpecParser is imported only when needed.
+        obj = self.get(text, kind)
+        if obj is None:
+            from .spec_parser import SpecParser
+            sp = SpecParser(text)
+            pspec = sp.parse()
+            objs = {
+                PSPEC : pspec,
+                GRAMMAR : sp.ast_to_grammar(pspec.grammar),
+            }
+            for k, o in objs.items():
+                self.put(text, o, k)
+            obj = objs[kind]
+        return obj
+
+    def get(self, text, kind = PSPEC):
+        # Returns the cached object, or None if it is missing,
+        # unreadable, corrupt, or was written for a different key.
+        try:
+            with open(self.path(text, kind), 'rb') as fh:
+                header, obj = pickle.load(fh)
+        except Exception:
+            return None
+        if header == self.header(text):
+            return obj
+        else:
+            return None
+
+    def put(self, text, obj, kind = PSPEC):
+        # Writes the object to the cache. To avoid leaving partial files
+        # for concurrent readers, we write to a temp file and rename it.
+        # Returns True on success.
+        path = self.path(text, kind)
+        tmp_path = None
+        try:
+            path.parent.mkdir(parents = True, exist_ok = True)
+            fd, tmp_path = tempfile.mkstemp(dir = path.parent, suffix = '.tmp')
+            with os.fdopen(fd, 'wb') as fh:
+                data = (self.header(text), obj)
+                pickle.dump(data, fh, protocol = pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, path)
+            return True
+        except Exception:
+            if tmp_path:
+                try:
+                    os.unlink(tmp_path)
+                except OSError:
+                    pass
+            return False
+
+####
+# Helpers.
+####
+
+def default_cache_dir():
+    # $ARGLE_CACHE_DIR, else $XDG_CACHE_HOME/argle, else ~/.cache/argle.
+    d = os.environ.get(CACHE_DIR_ENV)
+    if d:
+        return Path(d)
+    xdg = os.environ.get('XDG_CACHE_HOME')
+    base = Path(xdg) if xdg else Path.home() / '.cache'
+    return base / 'argle'
+
+def parse_spec(text, cache_dir = None):
+    # Convenience function: parse a spec through a SpecCache.
+    return SpecCache(cache_dir).parse(text)
@@ -0,0 +1,202 @@
+r'''
+
+Ahead-of-time compilation of a spec into an importable Python module.
+
+SpecCompiler parses a spec and generates Python source that rebuilds its
+normalized Grammar (see SpecParser.ast_to_grammar) directly: one flat
+assignment per object, in dependency order, with no lexing or parsing at
+import time. The generated module imports only argle.grammar, and can be
+checked into a package, where the bytecode cache makes importing it cheap.
+
+Usage:
+
+    # Command line.
+    argle-compile SPEC_PATH [--output PATH]
+
+    # Code.
+    src = SpecCompiler(spec_text).source()
+
+    # Using the generated module.
+    from compiled_spec import GRAMMAR
+    args = Parser(grammar = GRAMMAR).parse()
+
+The generated module defines:
+
+    GRAMMAR        | The Grammar.
+    SPEC_HASH      | The spec_hash() of the spec text.
+    ARGLE_VERSION  | The Argle version that compiled it.
+
+Programs can compare SPEC_HASH with spec_hash(SPEC) to detect a stale module.
+
+'''
+
+####
+# Imports.
+####
+
+import dataclasses
+import hashlib
+import sys
+
+from pathlib import Path
+from textwrap import dedent
+
+from .spec_parser import SpecParser
+from .version import __version__
+
+####
+# SpecCompiler.
+####
+
+# Types emitted as Python literals.
+SCALAR_TYPES = (type(None), bool, int, float, str)
+
+class SpecCompiler:
+
+    def __init__(self, text, source_name = None):
+        self.text = text
+        self.source_name = source_name
+
+        # Populated by source():
+        # - Lines of generated statements.
+        # - Variable names of emitted objects, keyed by id().
+        # - Module aliases, keyed by module name.
+        # - The objects themselves, to keep their ids valid.
+        self.lines = []
+        self.names = {}
+        self.modules = {}
+        self.emitted = []
+
+    def source(self):
+        # Parses the spec and returns the text of the generated module.
+        sp = SpecParser(self.text)
+        g = sp.ast_to_grammar(sp.parse().grammar)
+        self.lines = []
+        self.names = {}
+        self.modules = {}
+        self.emitted = []
+        top = self.expr(g)
+
+        # Module header and imports.
+        src = self.source_name or '<spec>'
+        header = [
+            f'# Generated by argle.spec_compiler from {src}.',
+            '# Do not edit: recompile the spec instead.',
+            '',
+        ]
+        imports = [
+            f'import {mod} as {alias}'
+            for mod, alias in sorted(self.modules.items())
+        ]
+        consts = [
+            '',
+            f'ARGLE_VERSION = {__version__!r}',
+            f'SPEC_HASH = {spec_hash(self.text)!r}',
+            '',
+        ]
+        footer = [
+            '',
+            f'GRAMMAR = {top}',
+            '',
+        ]
+        return '\n'.join(header + imports + consts + self.lines + footer)
+
+    def expr(self, obj):
+        # Returns a Python expression for the object. Scalars and containers
+        # are written inline. Other objects are assigned to a variable (once,
+        # even if shared) and the variable name is returned.
+        if isinstance(obj, SCALAR_TYPES):
+            return repr(obj)
+        elif isinstance(obj, list):
+            return '[' + ', '.join(self.expr(x) for x in obj) + ']'
+        elif isinstance(obj, tuple):
+            return '(' + ''.join(self.expr(x) + ', ' for x in obj) + ')'
+        elif isinstance(obj, dict):
+            return '{' + ', '.join(
+                f'{self.expr(k)}: {self.expr(v)}'
+                for k, v in obj.items()
+            ) + '}'
+
+        # Already emitted.
+        name = self.names.get(id(obj))
+        if name:
+            return name
+
+        # Get the keyword arguments needed to construct the object.
+        if dataclasses.is_dataclass(obj) and not isinstance(obj, type):
+            kws = {
+                f.name : getattr(obj, f.name)
+                for f in dataclasses.fields(obj)
+                if f.init
+            }
+        else:
+            cls_name = type(obj).__name__
+            raise TypeError(f'SpecCompiler cannot emit {cls_name} objects')
+
+        # Emit the statement, after the statements for its arguments.
+        args = ', '.join(
+            f'{k} = {self.expr(v)}'
+            for k, v in kws.items()
+        )
+        name = f'_{len(self.names)}'
+        self.names[id(obj)] = name
+        self.emitted.append(obj)
+        self.lines.append(f'{name} = {self.class_ref(obj)}({args})')
+        return name
+
+    def class_ref(self, obj):
+        # Returns 'ALIAS.ClassName' and registers the module import.
+        cls = type(obj)
+        alias = self.modules.setdefault(cls.__module__, f'_m{len(self.modules)}')
+        return f'{alias}.{cls.__qualname__}'
+
+####
+# Helpers.
+####
+
+def spec_hash(text):
+    # SHA-256 of the spec text.
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+def compile_spec(text, source_name = None):
+    # Convenience function: returns the source of the generated module.
+    return SpecCompiler(text, source_name = source_name).source()
+
+####
+# Command-line entry point.
+####
+
+DESCRIPTION = dedent('''
+    Compile an Argle spec into a Python module that
+    builds the parsed spec without parsing it.
+''')
+
+ARG_CONFIGS = (
+    dict(
+        name = 'path',
+        metavar = 'SPEC_PATH',
+        help = 'Path to a file holding the spec',
+    ),
+    dict(
+        name = '--output -o',
+        metavar = 'PATH',
+        help = 'Write the module to PATH rather than stdout',
+    ),
+    dict(
+        add_help = True,
+    ),
+)
+
+def main(args = None):
+    from . import bargparse as bp
+    args = sys.argv[1:] if args is None else args
+    ap, opts = bp.parse_args(args, ARG_CONFIGS, description = DESCRIPTION)
+    text = Path(opts.path).read_text()
+    src = compile_spec(text, source_name = Path(opts.path).name)
+    if opts.output:
+        Path(opts.output).write_text(src)
+    else:
+        print(src, end = '')
+
+if __name__ == '__main__':
+    main()
@@ -146,6 +146,8 @@ Spec-parsing: the process:
         - The lexer uses its match_token() method to try to match each TokDef
           in self.tokdefs.
             - It tries them in order until it gets a match.
+            - In practice, the mode's TokDefTable folds the TokDefs into one
+              ordered regex alternation, so that search is a single call.
             - If the matched TokDef has emit=False:
                 - The lexer updates its position information.
                 - Then it goes through the self.tokdefs again, from the start.
@@ -318,17 +320,17 @@ Where quantifiers are handled
 # Imports.
 ####
 
-from dataclasses import dataclass, field
+from dataclasses import dataclass, field, replace as clone
 from functools import wraps
+from types import MethodType
 from typing import Union
-from copy import deepcopy
 
 from short_con import cons, constants
 
 from .constants import Chars, Pmodes
 from .errors import SpecParseError, ErrKinds, ErrMsgs
 from .regex_lexer import RegexLexer
-from .tokens import Token, TokDefs
+from .tokens import Token, TokDefs, TokDefTables
 from .utils import get, distilled, partition
 from .grammar import (
     TreeElem,
@@ -375,13 +377,35 @@ class ParseElem(TreeElem):
         alts.append(Alternative(elems = curr))
         return alts
 
-    def elems_without_partials(self, partials):
-        new = []
+    def expanded(self, partials, error, active = ()):
+        # Takes a Variant, Group, or Option, plus a dict of partial-variants.
+        # Returns a copy with each PartialUsage replaced by the elems of
+        # the partial, and with ChoiceSeps turned into Alternatives, all
+        # applied recursively to its Groups. Neither self nor the elems it
+        # shares with the copy (Positional, Literal, etc) are modified.
+        #
+        # Undefined partials and partials that use themselves are reported
+        # via the error function (see SpecParser.error), which must raise.
+        # The active tuple holds the names of the partials being expanded.
+        #
+        elems = []
         for e in self.elems:
             if isinstance(e, PartialUsage):
-                new.extend(partials[e.name].elems)
+                p = partials.get(e.name)
+                if p is None:
+                    error(ErrKinds.undefined_partial, name = e.name)
+                elif e.name in active:
+                    cycle = active[active.index(e.name):] + (e.name,)
+                    error(ErrKinds.partial_cycle, names = cycle)
+                new = p.expanded(partials, error, active + (e.name,))
+                elems.extend(new.elems)
+            elif isinstance(e, (Group, Option)):
+                elems.append(e.expanded(partials, error, active))
             else:
-                new.append(e)
+                elems.append(e)
+        new = clone(self, elems = elems)
+        if not isinstance(new, Option):
+            new.elems = new.elems_to_alternatives()
         return new
 
 VariantElem = Union[
@@ -555,10 +579,12 @@ class BareOption(ParseElem):
     # An intermediate object used when parsing (a) an option,
     # or (b) aliases in an opt-spec.
     name: str
+    prefix: str = None
 
     def as_gelem(self):
         return GE.Alias(
             name = self.name,
+            prefix = self.prefix,
         )
 
 @dataclass
@@ -567,10 +593,12 @@ class Option(ParseElem):
     elems: list[OptionElem]
     ntimes: Quantifier = None
     aliases: list[BareOption] = field(default_factory = list)
+    prefix: str = None
 
     def as_gelem(self):
         return GE.Option(
             name = self.name,
+            prefix = self.prefix,
             dest = self.name,
             ntimes = gelem_or_none(self.ntimes),
             parameters = [e.as_gelem() for e in self.elems],
@@ -640,7 +668,11 @@ class Literal(ParseElem):
     text: str
 
     def as_gelem(self):
-        return GE.Literal(text = self.text)
+        # A quoted literal holds its text in a QuotedText.
+        text = self.text
+        if isinstance(text, QuotedText):
+            text = text.text
+        return GE.Literal(text = text)
 
 @dataclass
 class Alternative(ParseElem):
@@ -649,7 +681,7 @@ class Alternative(ParseElem):
     elems: list[VariantElem]
 
     def as_gelem(self):
-        return GE.Group(
+        return GE.Alternative(
             elems = [e.as_gelem() for e in self.elems],
         )
 
@@ -783,13 +815,19 @@ QuotedTDs = cons(
 
 class SpecParser:
 
-    def __init__(self, text, debug = False):
+    def __init__(self, text, debug = False, profile = False):
         # The spec text.
         self.text = text
 
-        # The lexer.
+        # The lexer. Its counters (see LexerStats) are kept
+        # only when debugging or profiling.
         self.debug = debug
-        self.lexer = RegexLexer(text, self.taste, debug = self.debug)
+        self.lexer = RegexLexer(
+            text,
+            self.taste,
+            debug = self.debug,
+            stats = bool(debug or profile),
+        )
 
         # Set the initial mode, which triggers the setter
         # to tell the RegexLexer which TokDefs to use.
@@ -809,28 +847,57 @@ class SpecParser:
         # Used for error-reporting and debugging.
         self.parse_stack = []
 
+        # Opt-in profiling: a ParseProfile, or None. Callers can pass
+        # True for a new ParseProfile or pass their own, to aggregate
+        # stats over several specs.
+        self.profile = None
+        if profile:
+            from .profiling import ParseProfile
+            self.profile = ParseProfile() if profile is True else profile
+
+        # Unless debugging, shadow the parsing functions with their lean
+        # versions, which skip all debug() calls, or with their profiled
+        # versions: see track_parse().
+        if self.profile:
+            version = 'profiled'
+        elif debug:
+            version = None
+        else:
+            version = 'lean'
+        if version:
+            for name in TRACKED_METHODS:
+                f = getattr(getattr(type(self), name), version)
+                setattr(self, name, MethodType(f, self))
+
     @property
     def position(self):
-        return cons(
-            lexer_position = self.lexer.position,
-            mode = self.mode,
-            first_tok = self.first_tok,
-            next_token_index = self.next_token_index,
+        # A plain tuple: (LEXER_POSITION, MODE, FIRST_TOK, NEXT_TOKEN_INDEX).
+        # Positions are saved far more often than restored, so they
+        # should be cheap to build.
+        return (
+            self.lexer.position,
+            self.mode,
+            self.first_tok,
+            self.next_token_index,
         )
 
     @position.setter
     def position(self, pos):
-        self.lexer.position = pos.lexer_position
-        self.mode = pos.mode
-        self.first_tok = pos.first_tok
-        self.reset_eaten(pos.next_token_index)
+        # Setting the position is a reset: ie, backtracking.
+        if self.profile:
+            self.profile.backtrack(self.parse_stack)
+        lexer_position, mode, self.first_tok, next_token_index = pos
+        self.lexer.position = lexer_position
+        self.mode = mode
+        self.reset_eaten(next_token_index)
 
     @property
     def next_token_index(self):
         return len(self.eaten)
 
     def reset_eaten(self, next_token_index):
-        self.eaten = self.eaten[0 : next_token_index]
+        # Truncate in place, rather than copying the kept Tokens.
+        del self.eaten[next_token_index:]
 
     ####
     # Parse-tracking decorator.
@@ -838,12 +905,19 @@ class SpecParser:
     # Manages the indentation levels needed for debugging output
     # as we traverse the hierarchy of parsing-function calls.
     #
+    # The decorated method also carries a lean version, which only maintains
+    # the parse_stack. SpecParser.__init__() binds the lean versions when
+    # not debugging, so that normal parsing does no frame inspection or
+    # message formatting. Likewise, it binds the profiled versions, which
+    # also feed a ParseProfile, when profiling: see profiling.py.
+    #
     # Also TODO ...
     ####
 
     def track_parse(old_method):
         # Setup based on the name of the method being decorated.
         NAME = old_method.__name__
+        STACK_NAME = f'{NAME}()'
         MSG_PREFIX = '\n' if NAME == 'parse' else ''
 
         @wraps(old_method)
@@ -856,7 +930,7 @@ class SpecParser:
             # - Call the method.
             # - Call debug() to summarize the result.
             lex.debug_indent += 1
-            self.parse_stack.append(f'{NAME}()')
+            self.parse_stack.append(STACK_NAME)
             elem = old_method(self, *xs, **kws)
             self.parse_stack.pop()
             result = type(elem).__name__ if elem else False
@@ -866,6 +940,27 @@ class SpecParser:
             lex.debug_indent -= 1
             return elem
 
+        def lean_parsing_func(self, *xs, **kws):
+            self.parse_stack.append(STACK_NAME)
+            elem = old_method(self, *xs, **kws)
+            self.parse_stack.pop()
+            return elem
+
+        def profiled_parsing_func(self, *xs, **kws):
+            # Unlike the other versions, pop the parse_stack even if the
+            # method raises, because some callers catch SpecParseError
+            # and keep parsing: the profile's frames must stay in sync.
+            prof = self.profile
+            self.parse_stack.append(STACK_NAME)
+            prof.enter(NAME, len(self.eaten))
+            try:
+                return old_method(self, *xs, **kws)
+            finally:
+                prof.exit(NAME, len(self.eaten), self.parse_stack)
+                self.parse_stack.pop()
+
+        parsing_func.lean = lean_parsing_func
+        parsing_func.profiled = profiled_parsing_func
         return parsing_func
 
     ####
@@ -878,14 +973,10 @@ class SpecParser:
 
     @mode.setter
     def mode(self, mode):
-        # When the mode changes, we tell RegexLexer
-        # which tokens it should be looking for.
+        # When the mode changes, we tell RegexLexer which tokens it should be
+        # looking for, by handing it the precomputed TokDefTable for the mode.
         self._mode = mode
-        self.lexer.tokdefs = [
-            td
-            for td in TokDefs.values()
-            if mode in td.modes
-        ]
+        self.lexer.table = TokDefTables[mode]
 
     ####
     # Parse a spec.
@@ -937,7 +1028,7 @@ class SpecParser:
         is_partial = False
         tok = self.eat(TokDefs.variant_def)
         if tok:
-            name = tok.m[1]
+            name = tok.groups[1]
             if name.endswith(Chars.exclamation):
                 name = name[0:-1]
                 is_partial = True
@@ -997,11 +1088,11 @@ class SpecParser:
         tok = self.eat(TokDefs.scoped_section_title, TokDefs.section_title)
         if tok:
             if tok.isa(TokDefs.scoped_section_title):
-                scope = Scope(tok.m[1])
-                title = tok.m[2]
+                scope = Scope(tok.groups[1])
+                title = tok.groups[2]
             else:
                 scope = None
-                title = tok.m[1]
+                title = tok.groups[1]
             return SectionTitle(
                 title = title,
                 scope = scope,
@@ -1024,7 +1115,7 @@ class SpecParser:
         tok = self.eat(TokDefs.heading)
         if tok:
             return Heading(
-                title = tok.m[1].strip(),
+                title = tok.groups[1].strip(),
                 token = tok,
             )
         else:
@@ -1120,7 +1211,7 @@ class SpecParser:
     def partial_usage(self):
         tok = self.eat(TokDefs.partial_usage)
         if tok:
-            return PartialUsage(name = tok.m[1])
+            return PartialUsage(name = tok.groups[1])
         else:
             return None
 
@@ -1139,7 +1230,7 @@ class SpecParser:
         b = self.bare_option()
         if b:
             elems = self.parse_some(self.any_parameter, top_level = True)
-            e = Option(b.name, elems, None)
+            e = Option(b.name, elems, None, prefix = b.prefix)
             if elems:
                 return e
             else:
@@ -1158,7 +1249,7 @@ class SpecParser:
         # An opt-spec scope declaration.
         tok = self.eat(TokDefs.opt_spec_scope, TokDefs.opt_spec_scope_empty)
         if tok:
-            query_path = get(tok.m, 1)
+            query_path = get(tok.groups, 1)
             return Scope(query_path)
         else:
             return None
@@ -1196,6 +1287,7 @@ class SpecParser:
                 name = b.name,
                 elems = elems,
                 aliases = aliases,
+                prefix = b.prefix,
             )
             if elems:
                 return e
@@ -1211,7 +1303,8 @@ class SpecParser:
         # aliases in an opt-spec.
         tok = self.eat(TokDefs.long_option, TokDefs.short_option)
         if tok:
-            return BareOption(name = tok.m[1])
+            name = tok.groups[1]
+            return BareOption(name = name, prefix = tok.text[:-len(name)])
         else:
             return None
 
@@ -1342,7 +1435,7 @@ class SpecParser:
     def quant_range(self):
         tok = self.eat(TokDefs.quant_range)
         if tok:
-            text = TokDefs.whitespace.regex.sub('', tok.m[1])
+            text = TokDefs.whitespace.regex.sub('', tok.groups[1])
             xs = [
                 None if x == '' else int(x)
                 for x in text.split(Chars.hyphen)
@@ -1395,7 +1488,7 @@ class SpecParser:
                 Chars.backslash if tok.isa(LIT_SLASH) else
                 Chars.backquote1 if tok.isa(LIT_QUOTE1) else
                 Chars.backquote3 if tok.isa(LIT_QUOTE3) else
-                tok.m.group(0)
+                tok.text
             )
 
     ####
@@ -1491,7 +1584,7 @@ class SpecParser:
         closing_td = BPairs[tok.kind]
 
         # Get group name attached to opening bracket, if any.
-        group_name = get(tok.m, 1)
+        group_name = get(tok.groups, 1)
 
         # Parse the guts of the bracketed expression, using the helper
         # correspondng to the kind of expression.
@@ -1572,7 +1665,8 @@ class SpecParser:
 
         # The caller provides 1+ TokDefs, which are put in self.menu.
         self.menu = tds
-        self.lexer.debug(wanted = '|'.join(td.kind for td in tds))
+        if self.debug:
+            self.lexer.debug(wanted = '|'.join(td.kind for td in tds))
 
         # Ask the RegexLexer for another Token. That won't succeed unless:
         #
@@ -1590,13 +1684,14 @@ class SpecParser:
         elif tok.isa(TokDefs.eof, TokDefs.err):
             return None
         else:
-            self.lexer.debug(
-                eaten = tok.kind,
-                text = tok.text,
-                pos = tok.pos,
-                line = tok.line,
-                col = tok.col,
-            )
+            if self.debug:
+                self.lexer.debug(
+                    eaten = tok.kind,
+                    text = tok.text,
+                    pos = tok.pos,
+                    line = tok.line,
+                    col = tok.col,
+                )
             self.eaten.append(tok)
             return tok
 
@@ -1614,50 +1709,46 @@ class SpecParser:
         # top-level ParseElem and thus expect a first-of-line Token.
         # If so, we remember that token's indent and line.
         if self.first_tok is None:
+            if self.debug:
+                self.lexer.debug(ok = True, is_first = tok.is_first)
             if tok.is_first:
-                self.lexer.debug(ok = True, is_first = True)
                 self.first_tok = tok
                 return True
             else:
-                self.lexer.debug(ok = True, is_first = False)
                 return False
 
-        # A helper to call debug() for the remaining scenarios.
-        # The reason explains why the token is OK.
-        def do_debug(reason):
-            self.lexer.debug(
-                ok = bool(reason),
-                indent_reason = reason,
-                self_indent = self.first_tok.indent,
-                tok_indent = tok.indent,
-                caller_offset = 1,
-            )
-
         # For subsequent tokens in the expression, we expect:
         # - Parse mode quoted.
         # - Token from same line as the first.
         # - Token from continutation line indented farther than the
         #   first line of the expression.
+        #
+        # The reason explains why the token is OK.
         if self.mode == Pmodes.quoted:
-            do_debug('quoted')
-            return True
+            reason = 'quoted'
         elif self.first_tok.line == tok.line:
-            do_debug('line')
-            return True
+            reason = 'line'
         elif self.first_tok.indent < tok.indent:
-            do_debug('indent')
-            return True
+            reason = 'indent'
         else:
-            do_debug(False)
-            return False
+            reason = False
+
+        if self.debug:
+            self.lexer.debug(
+                ok = bool(reason),
+                indent_reason = reason,
+                self_indent = self.first_tok.indent,
+                tok_indent = tok.indent,
+            )
+        return bool(reason)
 
     ####
     # Converting the SpecAST to a Grammar.
     ####
 
     def ast_to_parsed_spec(self, ast):
+        # Converts the SpecAST, which is not modified, to a ParsedSpec.
         USE_NEW = False             # TODO: drop
-        ast_orig = deepcopy(ast)
 
         # Partition SpecAST.elems into:
         # - variants (ParseElem.Variants)
@@ -1665,55 +1756,69 @@ class SpecParser:
         is_variant = lambda e: isinstance(e, Variant)
         variants, others = partition(ast.elems, is_variant)
 
-        # For Variants (or their Groups) having a ChoiceSep,
-        # reorganize the elems into Alternatives.
-        for v in variants:
-            for we in v.traverse(Variant, Group):
-                e = we.val
-                e.elems = e.elems_to_alternatives()
+        # Convert the variants to a Grammar and the others to Sections.
+        g = self.variants_to_grammar(variants)
+        sections = self.elems_to_sections(others)
+
+        # TODO: opts: unify/reconcile: opt-specs <=> variants.
+        pass
+
+        # Return a ParsedSpec.
+        return ParsedSpec(
+            grammar = g if USE_NEW else ast,         # TODO: drop
+            sections = sections if USE_NEW else [],  # TODO: drop
+        )
+
+    def ast_to_grammar(self, ast):
+        # Returns the Grammar for a SpecAST, without modifying the SpecAST.
+        # Unlike ast_to_parsed_spec(), this always returns a GE.Grammar,
+        # so it is usable by code that needs one (eg, ArgvEngine).
+        variants = [
+            e
+            for e in ast.elems
+            if isinstance(e, Variant)
+        ]
+        return self.variants_to_grammar(variants)
+
+    def variants_to_grammar(self, variants, normalize = True):
+        # Takes PE.Variants, which are not modified. Returns a GE.Grammar.
+        # The normalize=False option is for benchmarks that time it apart.
 
-        # Build lookup dict for the partial-variants.
+        # Expand each non-partial Variant: partial-variants are replaced
+        # by their elems, and ChoiceSeps yield Alternatives.
         partials = {
             v.name : v
             for v in variants
             if v.is_partial
         }
-
-        # Variants: traverse and replace PartialUsage with actual elems.
-        for v in variants:
-            for we in v.traverse(Variant, Group, Alternative):
-                e = we.val
-                e.elems = e.elems_without_partials(partials)
+        expanded = [
+            v.expanded(partials, self.error)
+            for v in variants
+            if not v.is_partial
+        ]
 
         # Define a Grammar by converting each Variant to GE.Variant.
-        # to GrammarElem Variants.
-        ge_variants = [v.as_gelem() for v in variants]
-        g = GE.Grammar(variants = ge_variants)
+        g = GE.Grammar(variants = [v.as_gelem() for v in expanded])
 
-        # Normalize quantifiers and drop unneeded groups.
-        g.normalize_quantifiers()
-        g.drop_degenerate_groups()
+        # Normalize quantifiers and drop unneeded groups. These modify
+        # only the new GrammarElems.
+        if normalize:
+            g.normalize_quantifiers()
+            g.drop_degenerate_groups()
+        return g
 
-        # Organize the other elements into Sections.
+    def elems_to_sections(self, elems):
+        # Organize the elements into Sections.
         # Relevant elems: SectionTitle, Heading, BlockQuote, OptSpec.
         pe_sections = [Section()]
-        for e in others:
+        for e in elems:
             if isinstance(e, SectionTitle):
                 pe_sections.append(Section(title = e))
             else:
                 pe_sections[-1].elems.append(e)
 
         # Convert PE.Section to GE.Section.
-        sections = [s.as_gelem() for s in pe_sections]
-
-        # TODO: opts: unify/reconcile: opt-specs <=> variants.
-        pass
-
-        # Return a ParsedSpec.
-        return ParsedSpec(
-            grammar = g if USE_NEW else ast_orig,    # TODO: drop
-            sections = sections if USE_NEW else [],  # TODO: drop
-        )
+        return [s.as_gelem() for s in pe_sections]
 
     ####
     # Other helpers.
@@ -1767,3 +1872,9 @@ class SpecParser:
         err.parse_context = lex.get_context().for_error
         raise err
 
+# Names of the parsing functions decorated by track_parse().
+TRACKED_METHODS = tuple(
+    name
+    for name, f in vars(SpecParser).items()
+    if hasattr(f, 'lean')
+)
@@ -1,7 +1,13 @@
 
 import re
 
+try:
+    import re._parser as sre_parse
+except ImportError:
+    import sre_parse
+
 from dataclasses import dataclass
+from functools import cached_property
 
 from short_con import cons, constants
 
@@ -19,8 +25,8 @@ class TokDef:
     # Token kind/name.
     kind: str
 
-    # Regex to match the token.
-    regex: re.Pattern
+    # Regex pattern to match the token.
+    pattern: str
 
     # Parsing modes that use the Token.
     modes: list[str]
@@ -32,42 +38,96 @@ class TokDef:
     def isa(self, *tds):
         return any(self.kind == td.kind for td in tds)
 
-@dataclass
+    @cached_property
+    def regex(self):
+        # Compiled on first use rather than at import time. The lexer
+        # itself uses the TokDefTable alternations, not these regexes.
+        return re.compile(self.pattern)
+
+    @cached_property
+    def first_chars(self):
+        # Characters that a match must start with, or None if they
+        # cannot be determined from the regex.
+        return first_chars(self.pattern)
+
 class Token:
+    # A compact Token: slots rather than a dataclass, because the SpecParser
+    # holds every Token it eats. The regex Match is not kept: just the text
+    # and captured groups. Newline information is computed only if needed.
+
+    __slots__ = (
+        # Token kind/name.
+        'kind',
+
+        # The captured groups of the regex that found the Token,
+        # indexed like a Match: groups[0] is the full text.
+        # For Token(eof) and Token(err), groups=('',).
+        'groups',
+
+        # Position of the matched text within the larger corpus.
+        # - character index (0-based)
+        # - line and column number (1-based; user-facing)
+        'pos',
+        'line',
+        'col',
+
+        # Attributes related to the line on which the Token started:
+        # - Indentation of the line, in N of spaces.
+        # - Whether Token is the first on the line, other than Token(indent).
+        'indent',
+        'is_first',
+
+        # Cache for the newlines property.
+        '_newlines',
+    )
 
-    # Token kind/name.
-    kind: str
+    FIELDS = 'kind text pos line col indent is_first'.split()
 
-    # The actual text and the Match object that found it.
-    # For Token(eof) and Token(err), m=None.
-    text: str
-    m: re.Match
-
-    # Width of text, N of lines in it, and indexes of newline chars.
-    width: int
-    nlines: int
-    newlines: list[int]
-
-    # Position of the matched text within the larger corpus.
-    # - character index (0-based)
-    # - line and column number (1-based; user-facing)
-    pos: int
-    line: int
-    col: int
-
-    # Attributes related to the line on which the Token started:
-    # - Indentation of the line, in N of spaces.
-    # - Whether Token is the first on the line, other than Token(indent).
-    indent: int
-    is_first: bool
+    def __init__(self, kind, groups, pos, line, col, indent, is_first):
+        self.kind = kind
+        self.groups = groups
+        self.pos = pos
+        self.line = line
+        self.col = col
+        self.indent = indent
+        self.is_first = is_first
+        self._newlines = None
 
     def isa(self, *ts):
         return any(self.kind == t.kind for t in ts)
 
+    @property
+    def text(self):
+        return self.groups[0]
+
+    @property
+    def width(self):
+        return len(self.groups[0])
+
+    @property
+    def nlines(self):
+        # N of lines spanned by the text.
+        return self.groups[0].count(Chars.newline) + 1
+
+    @property
+    def newlines(self):
+        # Indexes of the newline characters in the text.
+        if self._newlines is None:
+            text = self.groups[0]
+            nls = []
+            i = text.find(Chars.newline)
+            while i != -1:
+                nls.append(i)
+                i = text.find(Chars.newline, i + 1)
+            self._newlines = nls
+        return self._newlines
+
     @property
     def brief(self):
-        ks = 'kind text pos line col indent is_first'.split()
-        return to_repr(self, *ks)
+        return to_repr(self, *self.FIELDS)
+
+    def __repr__(self):
+        return to_repr(self, *self.FIELDS)
 
 ####
 # Helper to define TokDefs.
@@ -125,7 +185,7 @@ def define_tokdefs():
     newline = r'\n'
 
     # Lines.
-    start_of_line = '(?m)^'
+    start_of_line = '(?m:^)'
     end_of_line = fr'{whitespace0}(?=\n)'
     rest_of_line = '.+'
 
@@ -267,17 +327,207 @@ def define_tokdefs():
             kind = kind,
             emit = emit,
             modes = [ModeLookup[a] for a in abbrevs if a.isalpha()],
-            regex = re.compile(LOCS[kind]),
+            pattern = LOCS[kind],
         )
         for kind, abbrevs, emit in td_tups
     ]
     return constants({td.kind : td for td in tds})
 
 ####
-# TokDefs and Rgxs.
+# Helpers to determine the characters a regex match can start with.
+####
+
+def first_chars(pattern):
+    # Takes a regex pattern. Returns a frozenset of the characters that a
+    # match must start with, or None if that cannot be determined (eg, the
+    # pattern uses a negated class, a category like \w, or can match empty).
+    try:
+        sp = sre_parse.parse(pattern)
+    except Exception:
+        return None
+    if sp.state.flags & re.IGNORECASE:
+        return None
+    result = seq_first_chars(sp)
+    if result is None:
+        return None
+    chars, nullable = result
+    return None if nullable else frozenset(chars)
+
+def seq_first_chars(items):
+    # Takes a sequence of parsed regex nodes. Returns (CHARS, NULLABLE) or
+    # None. NULLABLE means the sequence can match the empty string.
+    chars = set()
+    for op, av in items:
+        result = node_first_chars(op, av)
+        if result is None:
+            return None
+        cs, nullable = result
+        chars.update(cs)
+        if not nullable:
+            return (chars, False)
+    return (chars, True)
+
+def node_first_chars(op, av):
+    # Takes one parsed regex node. Returns (CHARS, NULLABLE) or None.
+    SP = sre_parse
+    if op == SP.LITERAL:
+        return ({chr(av)}, False)
+    elif op == SP.IN:
+        chars = set()
+        for iop, iav in av:
+            if iop == SP.LITERAL:
+                chars.add(chr(iav))
+            elif iop == SP.RANGE and iav[1] - iav[0] < 256:
+                chars.update(chr(i) for i in range(iav[0], iav[1] + 1))
+            else:
+                return None
+        return (chars, False)
+    elif op == SP.SUBPATTERN:
+        group, add_flags, del_flags, p = av
+        if add_flags & re.IGNORECASE:
+            return None
+        return seq_first_chars(p)
+    elif op in (SP.MAX_REPEAT, SP.MIN_REPEAT):
+        lo, hi, p = av
+        result = seq_first_chars(p)
+        if result is None:
+            return None
+        cs, nullable = result
+        return (cs, nullable or lo == 0)
+    elif op == SP.BRANCH:
+        chars = set()
+        nullable = False
+        for p in av[1]:
+            result = seq_first_chars(p)
+            if result is None:
+                return None
+            chars.update(result[0])
+            nullable = nullable or result[1]
+        return (chars, nullable)
+    elif op in (SP.AT, SP.ASSERT, SP.ASSERT_NOT):
+        # Zero-width: they restrict matches but consume nothing.
+        return (set(), True)
+    else:
+        return None
+
+####
+# Per-mode TokDef tables.
+####
+
+@dataclass(frozen = True)
+class TokDefTable:
+    # The TokDefs used in a parsing mode, frozen in priority order, along
+    # with compiled alternations of their regexes. Each TokDef regex is
+    # wrapped in a named group. Python alternation is ordered (the first
+    # alternative that matches wins), so one match() call finds the same
+    # TokDef as trying each TokDef regex in order.
+    #
+    # The alternations are indexed by first character. Each one holds only
+    # the TokDefs that can start with that character, plus those whose
+    # first characters are unknown (the fallback, used for any other
+    # character). The index is compiled when the mode is first used.
+
+    mode: str
+    tokdefs: tuple[TokDef]
+    lookup: dict
+
+    @classmethod
+    def for_mode(cls, mode, tokdefs):
+        tds = tuple(td for td in tokdefs if mode in td.modes)
+        return cls(
+            mode = mode,
+            tokdefs = tds,
+            lookup = {td.kind : td for td in tds},
+        )
+
+    @cached_property
+    def index(self):
+        # The first-character index, built on first use: (DISPATCH, FALLBACK).
+        # Each value is an (ALTERNATION, NGROUPS) tuple or None, where
+        # NGROUPS maps TokDef kind to the number of groups in its own regex.
+        tds = self.tokdefs
+
+        # Compiled alternations, keyed by tuple of TokDef kinds, so that
+        # characters with the same TokDefs share one regex.
+        rgxs = {}
+        def alternation(xs):
+            key = tuple(td.kind for td in xs)
+            if key not in rgxs:
+                rgxs[key] = compile_alternation(xs) if xs else None
+            return rgxs[key]
+
+        chars = set()
+        for td in tds:
+            chars.update(td.first_chars or ())
+        dispatch = {
+            c : alternation([
+                td for td in tds
+                if td.first_chars is None or c in td.first_chars
+            ])
+            for c in chars
+        }
+        fallback = alternation([
+            td for td in tds
+            if td.first_chars is None
+        ])
+        return (dispatch, fallback)
+
+    def match(self, text, pos):
+        # Returns the first TokDef matching at pos and a tuple of its
+        # captured groups, with the full match at index 0. Or None.
+        #
+        # In the alternation, the TokDef's own groups follow the named group
+        # wrapping it. That group closed last, so it is m.lastindex.
+        dispatch, fallback = self.index
+        alt = dispatch.get(text[pos : pos + 1], fallback)
+        m = alt[0].match(text, pos) if alt else None
+        if m:
+            kind = m.lastgroup
+            i = m.lastindex
+            groups = (m[0],) + m.groups()[i : i + alt[1][kind]]
+            return (self.lookup[kind], groups)
+        else:
+            return None
+
+    def candidates(self, char):
+        # Returns the kinds of the TokDefs in the alternation used for
+        # text starting with the character, in the order they are tried.
+        dispatch, fallback = self.index
+        alt = dispatch.get(char, fallback)
+        return tuple(alt[1]) if alt else ()
+
+def compile_alternation(tds):
+    # Takes TokDefs. Returns (REGEX, NGROUPS): see TokDefTable.index. The
+    # group counts come from the alternation itself, so that the TokDef
+    # regexes need not be compiled.
+    rgx = re.compile('|'.join(
+        f'(?P<{td.kind}>{td.pattern})'
+        for td in tds
+    ))
+    starts = [rgx.groupindex[td.kind] for td in tds] + [rgx.groups + 1]
+    ngroups = {
+        td.kind : starts[i + 1] - starts[i] - 1
+        for i, td in enumerate(tds)
+    }
+    return (rgx, ngroups)
+
+####
+# TokDefs, TokDefTables, and Rgxs.
 ####
 
 TokDefs = define_tokdefs()
 
-Rgxs = constants({kind : td.regex for kind, td in TokDefs})
+TokDefTables = constants({
+    mode : TokDefTable.for_mode(mode, TokDefs.values())
+    for mode in Pmodes.values()
+})
+
+def __getattr__(name):
+    # Rgxs is built on first access (PEP 562), because it compiles
+    # every TokDef regex.
+    if name == 'Rgxs':
+        global Rgxs
+        Rgxs = constants({kind : td.regex for kind, td in TokDefs})
+        return Rgxs
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
 
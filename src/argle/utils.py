@@ -42,6 +42,18 @@ def to_repr(obj, *ks):
     )
     return f'{cls_name}({params})'
 
+def instance_attrs(obj):
+    # Returns a dict of the object's instance attributes,
+    # whether they are held in its __dict__ or in slots.
+    d = getattr(obj, '__dict__', None)
+    if d is not None:
+        return d
+    return {
+        k : getattr(obj, k)
+        for cls in reversed(type(obj).__mro__)
+        for k in getattr(cls, '__slots__', ())
+    }
+
 def distilled(obj, *attrs):
     # Takes an object and some attrs.
     # Returns a new short-con dataclass having the same class name as the
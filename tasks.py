@@ -10,6 +10,7 @@
 # Tasks:
 #   inv tags
 #   inv test [--cov]
+#   inv bench [--scales 1,10,100] [--specs NAMES] [--json PATH] [--compare PATH]
 #   inv dist [--publish] [--test]
 #   inv tox
 #   inv bump [--kind <major|minor|patch>] [--local]
@@ -69,6 +70,21 @@ def path_for_test_func(func):
         txt = '\n'.join(paths)
         sys.exit(f'Too many matching paths.\n{txt}')
 
+@task
+def bench(c, scales = '1,10,100', specs = None, repeat = 3, json = None, compare = None):
+    '''
+    Run the spec-parsing benchmark suite, optionally writing or comparing JSON results.
+    '''
+    args = [f'--scales {scales}', f'--repeat {repeat}']
+    if specs:
+        args.append(f'--specs {specs}')
+    if json:
+        args.append(f'--json {json}')
+    if compare:
+        args.append(f'--compare {compare}')
+    cmd = 'python benchmarks/bench_spec_suite.py ' + ' '.join(args)
+    c.run(cmd, env = dict(PYTHONPATH = 'src'))
+
 @task
 def tox(c):
     '''
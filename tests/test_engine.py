@@ -0,0 +1,280 @@
+import pytest
+
+from pathlib import Path
+
+from argle import Parser
+from argle.engine import ArgvEngine, flat_slots
+from argle.errors import ArgvParseError, ErrKinds
+from argle.nfa import DFA
+from argle.spec_parser import SpecParser
+
+SPECS_DIR = Path('tests') / 'data' / 'specs'
+
+def parse_ok(engine, args):
+    return dict(engine.parse(args.split()))
+
+def parse_err(engine, args):
+    with pytest.raises(ArgvParseError) as einfo:
+        engine.parse(args.split())
+    return einfo.value
+
+def test_engine_naval_fate(tr):
+    e = ArgvEngine.from_spec((SPECS_DIR / 'naval-fate.txt').read_text())
+
+    # Variants are selected by the positional choices.
+    assert parse_ok(e, 'ship new A B') == dict(
+        weapon = 'ship',
+        action = 'new',
+        name = ['A', 'B'],
+    )
+    assert parse_ok(e, 'ship X move 1 2 --speed 9') == dict(
+        weapon = 'ship',
+        name = 'X',
+        action = 'move',
+        x = '1',
+        y = '2',
+        speed = '9',
+    )
+    assert parse_ok(e, 'mine set 1 2 --moored') == dict(
+        weapon = 'mine',
+        action = 'set',
+        x = '1',
+        y = '2',
+        moored = True,
+        drifting = None,
+    )
+
+    # Errors.
+    assert parse_err(e, 'mine set 1 2 --blort').isa(ErrKinds.unknown_option)
+    assert parse_err(e, 'tank new A').isa(ErrKinds.invalid_choice)
+    assert parse_err(e, 'ship shoot 1 2 3').isa(ErrKinds.unexpected_positional)
+
+def test_engine_options(tr):
+    spec = '<src> <dst>... [-n <a> <b>] [--level <x>] [--verbose] [--tag <t>...]{3}\n'
+    e = ArgvEngine.from_spec(spec)
+
+    # Positional allocation leaves enough args for later slots.
+    assert parse_ok(e, 'A B C') == dict(
+        src = 'A',
+        dst = ['B', 'C'],
+        n = None,
+        level = None,
+        verbose = None,
+        tag = None,
+    )
+
+    # Option params, --opt=val, repeated options, negative numbers, and --.
+    # Params are bound greedily: --tag takes all args up to the next option.
+    got = parse_ok(e, 'A -n 1 2 B -7 --level=3 --tag x y --tag z -- --verbose')
+    assert got == dict(
+        src = 'A',
+        dst = ['B', '-7', '--verbose'],
+        n = ['1', '2'],
+        level = '3',
+        verbose = None,
+        tag = [['x', 'y'], ['z']],
+    )
+
+    # Errors.
+    assert parse_err(e, 'A B -n 1').isa(ErrKinds.missing_params)
+    assert parse_err(e, 'A B --verbose --verbose').isa(ErrKinds.too_many_occurrences)
+    assert parse_err(e, 'A B --verbose=1').isa(ErrKinds.unexpected_param)
+    assert parse_err(e, 'A').isa(ErrKinds.missing_positional)
+
+def test_engine_option_prefixes(tr):
+    # Options keep the dashes from the spec, whatever their length.
+    e = ArgvEngine.from_spec('<x> [--a] [-b] [--long]\n')
+    assert list(e.tables[0].options) == ['--a', '-b', '--long']
+    assert parse_ok(e, 'X --a -b --long') == dict(x = 'X', a = True, b = True, long = True)
+    assert parse_err(e, 'X -a').isa(ErrKinds.unknown_option)
+
+def test_engine_specs(tr):
+    # The example specs compile, with one VariantTable per variant
+    # (or one empty table, if there are no variants).
+    for path in sorted(SPECS_DIR.glob('*.txt')):
+        sp = SpecParser(path.read_text())
+        g = sp.ast_to_grammar(sp.parse().grammar)
+        e = ArgvEngine(g)
+        assert len(e.tables) == max(1, len(g.variants)) == len(e.nfa.starts)
+
+    # Partial variants are merged into the others, not kept.
+    e = ArgvEngine.from_spec((SPECS_DIR / 'repo.txt').read_text())
+    assert [vt.name for vt in e.tables] == ['clone', 'commit', 'copy', 'delete', 'setuser']
+    assert parse_ok(e, 'copy a b c --force --config')['src'] == ['a', 'b']
+    assert parse_ok(e, 'clone A --deep')['deep'] is True
+
+def test_engine_parse_specs(tr):
+    # Every example spec parses args to a Result or raises ArgvParseError.
+    # Specs holding only opt-specs have no variants: they accept no args.
+    for path in sorted(SPECS_DIR.glob('*.txt')):
+        p = Parser(spec = path.read_text())
+        for args in ([], ['x'], ['x', '-y']):
+            try:
+                p.parse(args)
+            except ArgvParseError:
+                pass
+        if not p.get_argv_engine().grammar.variants:
+            assert dict(p.parse([])) == {}
+            assert parse_err(p, 'x').isa(ErrKinds.unexpected_positional)
+
+def test_engine_greedy_allocation(tr):
+    # A variable-length slot followed by a slot with choices (or by an
+    # optional slot needing 2+ args) is matched via the NFA, because the
+    # greedy one-pass allocation would take args needed later.
+    e = ArgvEngine.from_spec('<src>... <cmd=run> [<extra>]\n')
+    assert not e.tables[0].flat
+    assert parse_ok(e, 'a b run z') == dict(src = ['a', 'b'], cmd = 'run', extra = 'z')
+    parse_err(e, 'a b z')
+
+    e = ArgvEngine.from_spec('[<a>] [<b>{2}]\n')
+    assert not e.tables[0].flat
+    assert parse_ok(e, 'x y') == dict(a = None, b = ['x', 'y'])
+
+    # Otherwise the allocation stays one-pass.
+    e = ArgvEngine.from_spec('<cmd=run> <src>... <dst>\n')
+    assert e.tables[0].flat
+    assert parse_ok(e, 'run a b c') == dict(cmd = 'run', src = ['a', 'b'], dst = 'c')
+
+def test_engine_accepted_fallback(tr):
+    # When the DFA accepts the positionals, a failed one-pass allocation
+    # falls back to the Pike VM rather than rejecting the args.
+    e = ArgvEngine.from_spec('<src>... <cmd=run> [<extra>]\n')
+    vt = e.tables[0]
+    vt.flat = True
+    vt.positionals = flat_slots(e.grammar.variants[0].elems)
+    vt.min_needed = [2, 1, 0, 0]
+    with pytest.raises(ArgvParseError):
+        e.allocate_positionals(vt, 'a b run z'.split(), 0)
+    assert e.dfa.match('a b run z'.split())
+    assert parse_ok(e, 'a b run z') == dict(src = ['a', 'b'], cmd = 'run', extra = 'z')
+    parse_err(e, 'a b z')
+
+def test_engine_alternative_options(tr):
+    # Options in different alternatives cannot be combined, and one
+    # alternative is needed unless the choice is optional.
+    e = ArgvEngine.from_spec('<x> (-a | -b)\n')
+    assert parse_ok(e, 'X -b') == dict(x = 'X', a = None, b = True)
+    err = parse_err(e, 'X -a -b')
+    assert err.isa(ErrKinds.conflicting_options)
+    assert err.params['options'] == ['-a', '-b']
+    err = parse_err(e, 'X')
+    assert err.isa(ErrKinds.missing_alternative)
+    assert err.params['options'] == ['-a', '-b']
+
+    e = ArgvEngine.from_spec('-x <n> | -y <m>\n')
+    assert parse_ok(e, '-y 2') == dict(x = None, y = '2')
+    assert parse_err(e, '-x 1 -y 2').isa(ErrKinds.conflicting_options)
+    assert parse_err(e, '').isa(ErrKinds.missing_alternative)
+
+    # Optional choices, and branches not needing an option.
+    e = ArgvEngine.from_spec('<x> [-a | -b]\n')
+    assert parse_ok(e, 'X') == dict(x = 'X', a = None, b = None)
+    assert parse_err(e, 'X -a -b').isa(ErrKinds.conflicting_options)
+    e = ArgvEngine.from_spec('<x> ([-a] | -b)\n')
+    assert parse_ok(e, 'X') == dict(x = 'X', a = None, b = None)
+
+    # Repeated choices can use any branch each time.
+    e = ArgvEngine.from_spec('<x> (-a | -b)...\n')
+    assert parse_ok(e, 'X -a -b') == dict(x = 'X', a = [True], b = [True])
+
+def test_engine_ambiguities(tr, monkeypatch):
+    # Naval fate: 'ship new move 1 2' fits two variants. The first wins.
+    e = ArgvEngine.from_spec((SPECS_DIR / 'naval-fate.txt').read_text())
+    assert e.ambiguities == [((0, 1), ['ship', 'new', 'move', '<arg>', '<arg>'])]
+    assert parse_ok(e, 'ship new move 1 2')['name'] == ['move', '1', '2']
+
+    # Strict mode raises.
+    with pytest.raises(ArgvParseError) as einfo:
+        ArgvEngine.from_spec('a : <x>\nb : <y> [<z>]\n', strict = True)
+    err = einfo.value
+    assert err.isa(ErrKinds.ambiguous_grammar)
+    assert err.params['variants'] == ('a', 'b')
+    assert err.params['example'] == ['<arg>']
+
+    # Unambiguous.
+    e = ArgvEngine.from_spec('a : <x=a>\nb : <y> <z>\n', strict = True)
+    assert e.ambiguities == []
+
+    # Without a DFA, the ambiguities come from the NFA.
+    e = ArgvEngine.from_spec((SPECS_DIR / 'naval-fate.txt').read_text())
+    e.dfa = None
+    assert e.ambiguities == [((0, 1), ['ship', 'new', 'move', '<arg>', '<arg>'])]
+    e = ArgvEngine.from_spec('a : <x=p|q> <y>\nb : <x=q|r> <y=s>\nc : <x=p>\n')
+    e.dfa = None
+    assert e.ambiguities == [(('a', 'b'), ['q', 's'])]
+
+    # Including in strict mode, when the DFA is infeasible.
+    monkeypatch.setattr(DFA, 'build', classmethod(lambda cls, nfa: None))
+    with pytest.raises(ArgvParseError) as einfo:
+        ArgvEngine.from_spec('a : <x>\nb : <y> [<z>]\n', strict = True)
+    assert einfo.value.params['variants'] == ('a', 'b')
+
+def test_engine_nfa(tr):
+    # Alternatives and repeated groups of positionals.
+    e = ArgvEngine.from_spec('(<p=a>... <q> | <r=b>) (<x> <y>){2}\n')
+    assert not e.tables[0].flat
+    assert parse_ok(e, 'a a Q 1 2 3 4') == dict(p = ['a', 'a'], q = 'Q', r = None, x = ['1', '3'], y = ['2', '4'])
+    assert parse_ok(e, 'b 1 2 3 4') == dict(p = None, q = None, r = 'b', x = ['1', '3'], y = ['2', '4'])
+    assert parse_err(e, 'a Q 1 2 3').isa(ErrKinds.missing_positional)
+    assert parse_err(e, 'c 1 2 3 4').isa(ErrKinds.invalid_choice)
+    assert parse_err(e, 'b 1 2 3 4 5').isa(ErrKinds.unexpected_positional)
+
+    # Blort: a repeated group with positionals and an option.
+    e = ArgvEngine.from_spec((SPECS_DIR / 'blort.txt').read_text())
+    got = parse_ok(e, 'A B C -z D E F -z -x')
+    assert (got['a'], got['b'], got['c']) == (['A', 'D'], ['B', 'E'], ['C', 'F'])
+    assert got['z'] == [True, True]
+    assert parse_err(e, 'A B C D -z').isa(ErrKinds.missing_positional)
+
+    # Neck diagram: the DFA would be too big, so the NFA is simulated.
+    # The DFA is not built until the engine has been used enough.
+    e = ArgvEngine.from_spec((SPECS_DIR / 'neck-diagram.txt').read_text())
+    assert 'dfa' not in e.__dict__
+    assert e.dfa is None
+    got = parse_ok(e, 'snum 1 / fnum 2 / number on / tuning E A')
+    assert got['cmd'] == ['snum', 'fnum', 'number', 'tuning']
+    assert (got['snum'], got['fnum']) == (['1'], ['2'])
+    assert got['numbering'] == ['on']
+    assert got['notes'] == ['E', 'A']
+    assert parse_err(e, 'number up').isa(ErrKinds.invalid_choice)
+
+def test_engine_anchors(tr):
+    # Variants indexed by the anchor texts their first positional must be.
+    spec = '\n'.join([
+        'clone  : <command=clone> <src> [--opt <a>]',
+        'commit : <command=commit> [<file>]... [--opt <a> <b>]',
+        'nav    : `go` (`up` | `down`)',
+        'misc   : [<x>] [--help]',
+        'either : <action=push|pull> <remote>',
+    ]) + '\n'
+    e = ArgvEngine.from_spec(spec)
+    anchors = e.anchors
+    assert anchors.unanchored == [3]
+    assert anchors.candidates('commit') == [1, 3]
+    assert anchors.candidates('pull') == [3, 4]
+    assert anchors.candidates('go') == [2, 3]
+    assert anchors.candidates('up') == [3]
+    assert anchors.candidates(None) == [3]
+
+    # Parsing, with per-variant scans (--opt params differ) and
+    # with NFA simulation.
+    assert e.union_options is None
+    for dfa in (e.dfa, None):
+        e.dfa = dfa
+        assert parse_ok(e, 'clone A --opt 1')['opt'] == '1'
+        assert parse_ok(e, 'commit --opt 1 2 a b')['file'] == ['a', 'b']
+        assert parse_ok(e, 'pull origin')['action'] == 'pull'
+        assert parse_ok(e, 'go down') == {}
+        assert parse_ok(e, '--help')['help'] is True
+        assert parse_err(e, 'clone A B').isa(ErrKinds.unexpected_positional)
+
+def test_parser_normal_mode(tr):
+    spec = '[-i] [-v] <rgx> <path>\n'
+    p = Parser(spec = spec)
+    got = p.parse('-i foo bar'.split())
+    assert dict(got) == dict(i = True, v = None, rgx = 'foo', path = 'bar')
+
+    # No-config parsing is still available on request.
+    assert p.parse(['x'], mode = 'flag').positionals == 'x'
+    with pytest.raises(NotImplementedError):
+        p.events(['x'])
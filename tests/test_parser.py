@@ -1,10 +1,18 @@
+import copy
+import os
+import pickle
 import pytest
+import subprocess
+import sys
+
 from collections import OrderedDict
 
 from argle import (
+    CompactResult,
     Parser,
     Result,
 )
+from argle.parser import ArgsView, PackedStrs
 
 def test_parse_noconfig_flag(tr):
     p = Parser()
@@ -42,6 +50,93 @@ def test_parse_noconfig_flag(tr):
     got = p.parse(args)
     assert dict(got) == exp
 
+    # Edge cases: args the fast prefix checks must leave to the regexes.
+    args = [
+        'A', '-\u017f', 'B', '-a\n', 'C', '--foo-bar\n', '-5', '-', '',
+        '--x-y', '--9', '-ab', '-Z', '--\u00e9t\u00e9', '-K', '--a__b',
+        '-\u0663', 'D', '--', 'E', '--x-y', '--a_b-c',
+    ]
+    exp = [
+        ('positionals', ['A', 'E']),
+        ('\u017f', 'B'),
+        ('a', 'C'),
+        ('foo_bar', ['-5', '-', '']),
+        ('x_y', ['--9', '-ab']),
+        ('Z', '--\u00e9t\u00e9'),
+        ('K', True),
+        ('a__b', ['-\u0663', 'D']),
+        ('a_b_c', True),
+    ]
+    got = p.parse(args)
+    assert list(got) == exp
+
+def test_parse_noconfig_modes(tr):
+    args = 'AA -27 -f F --go G1 G2 -x BB -- CC'.split()
+
+    # Greedy: options bind all values up to the next option.
+    p = Parser(mode = 'greedy')
+    exp = {
+        'f': 'F',
+        'go': ['G1', 'G2'],
+        'x': 'BB',
+        'positionals': ['AA', '-27', 'CC'],
+    }
+    assert dict(p.parse(args)) == exp
+    assert p.parse(args) == Parser().parse(args)
+
+    # Key-val: options bind at most one value.
+    p = Parser(mode = 'key_val')
+    exp = {
+        'f': 'F',
+        'go': 'G1',
+        'x': 'BB',
+        'positionals': ['AA', '-27', 'G2', 'CC'],
+    }
+    assert dict(p.parse(args)) == exp
+    assert dict(Parser().parse(args, mode = 'key_val')) == exp
+
+    # Args from an iterator (eg, streamed from a file) are
+    # parsed the same way as a list.
+    for mode in ('flag', 'key_val', 'greedy'):
+        p = Parser(mode = mode)
+        exp = p.parse(args)
+        assert p.parse(iter(args)) == exp
+        assert p.parse(a for a in args) == exp
+
+    # Invalid mode.
+    with pytest.raises(NotImplementedError):
+        Parser(mode = 'blort').parse(args)
+
+def test_parse_noconfig_incremental(tr):
+    args = 'AA -f F --go G1 G2 -- BB'.split()
+    exp_events = [
+        ('positionals', 'AA'),
+        ('f', None),
+        ('f', 'F'),
+        ('go', None),
+        ('go', 'G1'),
+        ('go', 'G2'),
+        ('positionals', 'BB'),
+    ]
+
+    # Events.
+    p = Parser()
+    assert list(p.events(args)) == exp_events
+    assert list(p.events(iter(args), mode = 'key_val'))[-2:] == [
+        ('positionals', 'G2'),
+        ('positionals', 'BB'),
+    ]
+
+    # Feed and finish.
+    got = [p.feed(a) for a in args]
+    assert got == exp_events[:6] + [None] + exp_events[6:]
+    assert p.finish() == p.parse(args)
+
+    # Finish resets the Parser.
+    assert p.finish() == p.parse([])
+    p.feed('-x')
+    assert dict(p.finish()) == {'x': True}
+
 def test_result(tr):
     d = OrderedDict((
         ('f', True),
@@ -60,3 +155,110 @@ def test_result(tr):
     assert repr(res) == exp_str
     assert len(res) == len(d)
 
+def test_compact_result(tr):
+    args = ['A', 'B', '-f', '--go', 'G1', '\udcff', '\u00e9'] + [str(i) for i in range(20)]
+    exp = Parser().parse(args)
+    p = Parser(compact = True)
+    res = p.parse(args)
+
+    # Same data as a Result.
+    assert isinstance(res, CompactResult)
+    assert res == exp
+    assert exp == res
+    assert list(res) == list(exp)
+    assert len(res) == len(exp)
+    assert 'go' in res
+    assert res.f is True
+    assert res['f'] is True
+    with pytest.raises(AttributeError):
+        res.blort
+
+    # Values from a sequence of args are views of it. Values
+    # from an iterator of args are packed, and decoded on access.
+    assert isinstance(res.go, ArgsView)
+    res2 = p.parse(iter(args))
+    assert isinstance(res2.go, PackedStrs)
+    assert res2 == res
+    for r in (res, res2):
+        assert r.go[1] == '\udcff'
+        assert r.go[-1] == '19'
+        assert r.go[0:3] == ['G1', '\udcff', '\u00e9']
+        assert r.positionals == ['A', 'B']
+        assert repr(r) == repr(res)
+
+    # Repr: cached and truncated.
+    exp_str = "CompactResult(positionals=['A', 'B'], f=True, go=['G1', '\\udcff', '\u00e9', '0', '1', '2', '3', '4', '5', '6', ... 13 more])"
+    assert repr(res) == exp_str
+    assert str(res) is repr(res)
+
+    # Also via feed() and finish().
+    for a in args:
+        p.feed(a)
+    assert p.finish() == exp
+
+def test_compact_result_pickle(tr):
+    # Pickling and copying round trip, with both kinds of packed values.
+    args = ['A', 'B', '-f', '--go', 'G1', '\udcff', '\u00e9']
+    p = Parser(compact = True)
+    for res in (p.parse(args), p.parse(iter(args))):
+        repr(res)
+        for got in (pickle.loads(pickle.dumps(res)), copy.deepcopy(res), copy.copy(res)):
+            assert isinstance(got, CompactResult)
+            assert got == res
+            assert got.go == ['G1', '\udcff', '\u00e9']
+            assert repr(got) == repr(res)
+    with pytest.raises(AttributeError):
+        res._blort
+
+def test_packed_strs(tr):
+    xs = PackedStrs(['a', 'bb'])
+    assert (xs[0], xs[1], xs[-1], xs[-2]) == ('a', 'bb', 'bb', 'a')
+    for i in (2, -3):
+        with pytest.raises(IndexError):
+            xs[i]
+    assert list(xs) == ['a', 'bb']
+    assert xs[-5:] == ['a', 'bb']
+
+def test_args_view(tr):
+    # Runs of args for the same dest are stored as spans.
+    args = 'A B C -x X -- D E -x Y'.split()
+    res = Parser(compact = True).parse(args)
+    assert res.positionals.spans == [(0, 3), (6, 8)]
+    assert res.x.spans == [(4, 5), (9, 10)]
+    assert res == Parser().parse(args)
+    assert list(reversed(res.positionals)) == ['E', 'D', 'C', 'B', 'A']
+    assert 'D' in res.positionals
+    with pytest.raises(IndexError):
+        res.positionals[5]
+
+    # A dest with one value gets the arg itself.
+    res = Parser(compact = True).parse('A -x X'.split())
+    assert res.positionals == 'A'
+    assert res.x == 'X'
+
+    # A repeated option splits the run.
+    args = '-x X -x Y Z'.split()
+    res = Parser(compact = True).parse(args)
+    assert res.x.spans == [(1, 2), (3, 5)]
+    assert res == Parser().parse(args)
+
+def test_lazy_imports(tr):
+    # A no-config script should not import argparse or the spec parser.
+    code = '; '.join((
+        'import sys',
+        'from argle import Parser',
+        'Parser().parse(["a", "-x"])',
+        'mods = ("argparse", "argle.spec_parser", "argle.tokens")',
+        'print(*[m for m in mods if m in sys.modules])',
+    ))
+    env = dict(os.environ, PYTHONPATH = os.pathsep.join(sys.path))
+    cmd = [sys.executable, '-c', code]
+    proc = subprocess.run(cmd, env = env, capture_output = True, text = True, check = True)
+    assert proc.stdout.strip() == ''
+
+    # But the lazy attributes still work.
+    import argle
+    assert argle.bargparse.parse_args
+    assert 'bargparse' in dir(argle)
+    with pytest.raises(AttributeError):
+        argle.blort
@@ -0,0 +1,82 @@
+from argle import Parser, spec_cache
+from argle import grammar as GE
+from argle.engine import ArgvEngine
+from argle.spec_cache import SpecCache, parse_spec
+from argle.spec_parser import SpecParser
+
+SPEC = '''
+general! : [--verbose] [--log-file]
+clone    : general! <command=clone> <src> [<dst>]
+
+<src> : Repository source
+'''
+
+def test_spec_cache(tr, tmp_path, monkeypatch):
+    sc = SpecCache(tmp_path)
+    exp = SpecParser(SPEC).parse().grammar.pretty()
+
+    # First parse writes the cache file.
+    pspec = sc.parse(SPEC)
+    assert sc.path(SPEC).is_file()
+    assert pspec.grammar.pretty() == exp
+
+    # Second parse comes from the cache.
+    def fail(self):
+        raise AssertionError('parse() called')
+    monkeypatch.setattr(SpecParser, 'parse', fail)
+    pspec = sc.parse(SPEC)
+    assert pspec.grammar.pretty() == exp
+    assert parse_spec(SPEC, cache_dir = tmp_path).grammar.pretty() == exp
+
+def test_spec_cache_grammar(tr, tmp_path, monkeypatch):
+    # The normalized Grammar is cached too, and used by the Parser.
+    sc = SpecCache(tmp_path)
+    sp = SpecParser(SPEC)
+    exp = sp.ast_to_grammar(sp.parse().grammar).pretty()
+    g = sc.grammar(SPEC)
+    assert sc.path(SPEC, spec_cache.GRAMMAR).is_file()
+    assert isinstance(g, GE.Grammar)
+    assert g.pretty() == exp
+
+    # Later, neither parsing nor the conversion is needed.
+    def fail(*xs, **kws):
+        raise AssertionError('SpecParser used')
+    monkeypatch.setattr(SpecParser, 'parse', fail)
+    monkeypatch.setattr(SpecParser, 'ast_to_grammar', fail)
+    assert sc.grammar(SPEC).pretty() == exp
+    args = 'clone A --verbose'.split()
+    exp_args = {'command': 'clone', 'src': 'A', 'dst': None, 'verbose': True, 'log-file': None}
+    assert dict(ArgvEngine.from_spec(SPEC, spec_cache = sc).parse(args)) == exp_args
+    assert dict(Parser(spec = SPEC, spec_cache = sc).parse(args)) == exp_args
+
+def test_spec_cache_fallback(tr, tmp_path, monkeypatch):
+    sc = SpecCache(tmp_path)
+    exp = SpecParser(SPEC).parse().grammar.pretty()
+    path = sc.path(SPEC)
+
+    # Corrupt cache file: parse normally and rewrite the cache.
+    tmp_path.mkdir(exist_ok = True)
+    path.write_bytes(b'not a pickle')
+    assert sc.get(SPEC) is None
+    assert sc.parse(SPEC).grammar.pretty() == exp
+    assert sc.get(SPEC) is not None
+
+    # A different version yields a different key.
+    k1 = sc.key(SPEC)
+    monkeypatch.setattr(spec_cache, '__version__', '999.0.0')
+    assert sc.key(SPEC) != k1
+    assert sc.get(SPEC) is None
+
+    # Cache write failures are ignored.
+    blocker = tmp_path / 'blocker'
+    blocker.write_text('')
+    sc = SpecCache(blocker / 'sub')
+    assert sc.put(SPEC, None) is False
+    assert sc.parse(SPEC).grammar.pretty() == exp
+
+def test_default_cache_dir(tr, tmp_path, monkeypatch):
+    monkeypatch.setenv('ARGLE_CACHE_DIR', str(tmp_path))
+    assert SpecCache().cache_dir == tmp_path
+    monkeypatch.delenv('ARGLE_CACHE_DIR')
+    monkeypatch.setenv('XDG_CACHE_HOME', str(tmp_path))
+    assert SpecCache().cache_dir == tmp_path / 'argle'
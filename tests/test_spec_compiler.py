@@ -0,0 +1,67 @@
+import pytest
+
+from pathlib import Path
+
+from argle import Parser
+from argle import grammar as GE
+from argle.engine import ArgvEngine
+from argle.spec_compiler import SpecCompiler, compile_spec, spec_hash, main
+from argle.spec_parser import SpecParser
+from argle.version import __version__
+
+SPECS_DIR = Path('tests') / 'data' / 'specs'
+
+def load_compiled(src):
+    # Executes generated source and returns its namespace.
+    ns = {}
+    exec(compile(src, '<compiled-spec>', 'exec'), ns)
+    return ns
+
+def test_spec_compiler(tr):
+    for path in sorted(SPECS_DIR.glob('*.txt')):
+        text = path.read_text()
+        src = compile_spec(text, source_name = path.name)
+        ns = load_compiled(src)
+
+        # The compiled Grammar matches a freshly parsed one,
+        # and the module imports only argle.grammar.
+        sp = SpecParser(text)
+        exp = sp.ast_to_grammar(sp.parse().grammar)
+        got = ns['GRAMMAR']
+        assert isinstance(got, GE.Grammar)
+        assert got.pretty() == exp.pretty(), path
+        imports = [line.split()[1] for line in src.splitlines() if line.startswith('import ')]
+        assert imports in ([], ['argle.grammar']), path
+
+        # Metadata.
+        assert ns['SPEC_HASH'] == spec_hash(text)
+        assert ns['ARGLE_VERSION'] == __version__
+
+def test_spec_compiler_parsing(tr):
+    # The compiled Grammar can parse args.
+    text = (SPECS_DIR / 'naval-fate.txt').read_text()
+    g = load_compiled(compile_spec(text))['GRAMMAR']
+    args = 'ship new A B'.split()
+    exp = dict(ArgvEngine.from_spec(text).parse(args))
+    assert dict(ArgvEngine(g).parse(args)) == exp
+    assert dict(Parser(grammar = g).parse(args)) == exp
+
+def test_spec_compiler_shared_objects(tr):
+    # Objects referenced from multiple places are emitted once.
+    sc = SpecCompiler('x')
+    lit = GE.Literal(text = 'go')
+    assert sc.expr([lit, lit]) == '[_0, _0]'
+    assert len(sc.lines) == 1
+
+    # Unsupported objects.
+    with pytest.raises(TypeError):
+        sc.expr(object())
+
+def test_spec_compiler_main(tr, tmp_path):
+    spec_path = tmp_path / 'spec.txt'
+    out_path = tmp_path / 'compiled_spec.py'
+    spec_path.write_text('[-i] [-v] <rgx> <path>\n')
+    main([str(spec_path), '--output', str(out_path)])
+    ns = load_compiled(out_path.read_text())
+    assert isinstance(ns['GRAMMAR'], GE.Grammar)
+    assert ns['SPEC_HASH'] == spec_hash(spec_path.read_text())
@@ -1,14 +1,22 @@
 
+import importlib.util
 import io
+import pickle
 import pytest
 
-from dataclasses import dataclass
+from copy import deepcopy
+from dataclasses import dataclass, FrozenInstanceError
 from pathlib import Path
 from textwrap import dedent
 
 from short_con import cons, constants
 
+from argle import grammar as GE
+from argle.constants import Pmodes
+from argle.errors import SpecParseError
+from argle.regex_lexer import RegexLexer
 from argle.spec_parser import SpecParser
+from argle.tokens import Token, TokDefs, TokDefTables, first_chars
 
 # @pytest.mark.skip
 
@@ -153,9 +161,10 @@ def test_against_baselines(tr):
             '',
         ])
 
-        # Write the text we got.
+        # Write the text we got. The got directory is not tracked.
         gpath = esp.got_path
         epath = esp.exp_path
+        gpath.parent.mkdir(exist_ok = True)
         write_file(gpath, got_text)
 
         # Read the text we expect, if it exists.
@@ -179,6 +188,226 @@ def test_against_baselines(tr):
         else:
             tr.dump(msg)
 
+####
+# Lexer tests.
+####
+
+def test_tokdef_tables(tr):
+    # At every position of every ESpec, for every parsing mode, the
+    # TokDefTable should select the same TokDef as trying each TokDef
+    # regex in priority order.
+    for mode in Pmodes.values():
+        tds = [td for td in TokDefs.values() if mode in td.modes]
+        table = TokDefTables[mode]
+        assert table.tokdefs == tuple(tds)
+        for k, esp in ESpecs:
+            text = esp.spec
+            for pos in range(len(text) + 1):
+                exp = next(
+                    (
+                        (td, (m[0],) + m.groups())
+                        for td in tds
+                        for m in [td.regex.match(text, pos)]
+                        if m
+                    ),
+                    None,
+                )
+                got = table.match(text, pos)
+                assert got == exp, (mode, k, pos)
+
+def test_first_chars(tr):
+    # Patterns with known first characters.
+    assert TokDefs.long_option.first_chars == {'-'}
+    assert TokDefs.indent.first_chars == {' ', '\t'}
+    assert TokDefs.quant_range.first_chars == {'{'}
+    assert first_chars(r'(?:ab|c)?d') == {'a', 'c', 'd'}
+
+    # Patterns that cannot be classified.
+    assert TokDefs.quoted_char1.first_chars is None
+    assert TokDefs.rest_of_line.first_chars is None
+    assert TokDefs.eof.first_chars is None
+    assert first_chars(r'x*') is None
+    assert first_chars(r'(?i)a') is None
+
+def test_token(tr):
+    kws = dict(pos = 0, line = 1, col = 1, indent = 0, is_first = True)
+
+    # Newline data is computed from the text.
+    tok = Token('quoted_char3', ('ab\ncd\n',), **kws)
+    assert tok.text == 'ab\ncd\n'
+    assert tok.width == 6
+    assert tok.nlines == 3
+    assert tok.newlines == [2, 5]
+
+    # Groups are indexed like a Match.
+    tok = Token('long_option', ('--foo', 'foo'), **kws)
+    assert tok.groups[1] == 'foo'
+    assert tok.nlines == 1
+    assert tok.newlines == []
+    assert not hasattr(tok, '__dict__')
+
+def test_no_debug_fast_path(tr, monkeypatch):
+    # Without debugging, parsing never calls RegexLexer.debug().
+    def fail(*xs, **kws):
+        raise AssertionError('debug() called')
+    monkeypatch.setattr(RegexLexer, 'debug', fail)
+    sp = SpecParser(ESpecs.repo.spec, debug = False)
+    sp.parse()
+    assert sp.variant.__func__ is SpecParser.variant.lean
+
+def test_token_memo(tr):
+    # The pgrep specs require backtracking (variant vs opt-spec),
+    # so re-lexing after position resets should hit the memo.
+    sp = SpecParser(ESpecs.pgrep_2.spec, profile = True)
+    sp.parse()
+    lex = sp.lexer
+    assert lex.stats.memo_hits > 0
+    assert len(lex.memo) <= lex.stats.memo_misses
+
+def test_lexer_stats(tr):
+    # The RegexLexer counters are off by default.
+    sp = SpecParser(ESpecs.repo.spec)
+    sp.parse()
+    assert sp.lexer.stats is None
+
+    # When on, they are consistent with each other.
+    sp = SpecParser(ESpecs.repo.spec, profile = True)
+    sp.parse()
+    st = sp.lexer.stats
+    matches = st.matches
+    tried = st.tried
+    assert st.attempts == sum(matches.values()) + st.failures
+    assert st.attempts <= sum(tried.values())
+    assert sum(st.skipped.values()) == matches['whitespace'] + matches['newline'] + matches['indent']
+    assert st.rejected and st.reserved <= sum(st.rejected.values())
+    for kind, rate in st.hit_rates().items():
+        assert 0 <= rate <= 1
+        assert matches[kind] <= tried[kind]
+    assert 'quoted_char1' in st.report()
+
+def test_position_reset(tr):
+    # Restoring a saved position rewinds the lexer, the mode, and
+    # the eaten Tokens, truncating the latter in place.
+    sp = SpecParser(ESpecs.repo.spec)
+    eaten = sp.eaten
+    pos = sp.position
+    assert isinstance(pos, tuple)
+    sp.parse_some(sp.variant)
+    assert len(eaten) > 0
+    sp.position = pos
+    assert sp.eaten is eaten
+    assert eaten == []
+    assert sp.position == pos
+    assert sp.lexer.curr is None
+
+def test_ast_conversion_is_pure(tr):
+    # Converting the SpecAST to a Grammar does not modify it.
+    for es in ESpecs.values():
+        sp = SpecParser(es.spec)
+        pspec = sp.parse()
+        ast = pspec.grammar
+        before = ast.pretty()
+        g1 = sp.ast_to_grammar(ast)
+        g2 = sp.ast_to_grammar(ast)
+        assert ast.pretty() == before
+        assert g1.pretty() == g2.pretty()
+
+def test_partial_errors(tr):
+    # Undefined partials and cycles among partials are spec errors.
+    cases = (
+        ('p! : <a> p!\nx : p!\n', 'partial_cycle', ('p', 'p')),
+        ('p! : [q!]\nq! : (-a | p!)\nx : p!\n', 'partial_cycle', ('p', 'q', 'p')),
+        ('x : <a> q!\n', 'undefined_partial', 'q'),
+    )
+    for spec, kind, expected in cases:
+        with pytest.raises(SpecParseError) as einfo:
+            SpecParser(spec).parse()
+        err = einfo.value
+        assert err.isa(kind)
+        param = 'names' if kind == 'partial_cycle' else 'name'
+        assert err.params[param] == expected
+
+    # Using a partial more than once is fine.
+    sp = SpecParser('p! : <a>\nx : p! p!\n')
+    g = sp.ast_to_grammar(sp.parse().grammar)
+    assert len(g.variants[0].elems) == 2
+
+def test_spec_gen(tr):
+    # The synthetic-spec generator emits specs that SpecParser accepts.
+    path = Path('benchmarks') / 'spec_gen.py'
+    mspec = importlib.util.spec_from_file_location('spec_gen', path)
+    spec_gen = importlib.util.module_from_spec(mspec)
+    mspec.loader.exec_module(spec_gen)
+    for seed in range(3):
+        shape = spec_gen.SpecShape(
+            variants = 4,
+            partial_depth = 3,
+            nesting = 3,
+            quant_density = 0.5,
+            seed = seed,
+        )
+        text = spec_gen.generate(shape)
+        assert text == spec_gen.generate(shape)
+        spec_gen.check(text, shape)
+
+def test_quantifier_flyweight(tr):
+    # Quantifiers are frozen, slotted, and interned.
+    q = GE.Quantifier(m = 1, n = 1)
+    assert q is GE.Quantifier(1, 1, True, True)
+    assert q is GE.Quantifier.normalized(None)
+    assert GE.Quantifier(0, 1) != GE.Quantifier(1, 1)
+    assert GE.Quantifier.normalized(GE.Quantifier(0, 1)) is GE.Quantifier(1, 1, False)
+    assert not hasattr(q, '__dict__')
+    with pytest.raises(FrozenInstanceError):
+        q.m = 2
+
+    # Pickling and copying preserve identity.
+    assert pickle.loads(pickle.dumps(q)) is q
+    assert deepcopy(q) is q
+
+    # A normalized Grammar shares a few instances across its elems.
+    sp = SpecParser(ESpecs.wrangle.spec)
+    g = sp.ast_to_grammar(sp.parse().grammar)
+    qs = [
+        getattr(e, e.quant_attr)
+        for e in g.walk(GE.Group, GE.Positional, GE.Option, GE.Parameter)
+    ]
+    assert len(qs) > 3 * len(set(map(id, qs)))
+
+def test_profiling(tr):
+    # Profiling gives the same result and records stats per parsing
+    # function, including the backtracking of variant vs opt-spec.
+    es = ESpecs.pgrep_2
+    exp = SpecParser(es.spec).parse()
+    sp = SpecParser(es.spec, profile = True)
+    got = sp.parse()
+    assert got.grammar.pretty() == exp.grammar.pretty()
+    assert sp.variant.__func__ is SpecParser.variant.profiled
+    assert sp.parse_stack == []
+
+    # Stats.
+    stats = sp.profile.stats
+    assert stats['parse'].calls == 1
+    assert stats['parse'].tokens == len(sp.eaten)
+    assert stats['variant'].backtracks > 0
+    for fs in stats.values():
+        assert 0 <= fs.self_time <= fs.cum_time + 1e-9
+    total = stats['parse'].cum_time
+    assert sp.profile.total_time == pytest.approx(total)
+
+    # Collapsed stacks.
+    lines = sp.profile.collapsed().splitlines()
+    assert 'parse;variant;variant_elems' in [line.split()[0] for line in lines]
+    for line in lines:
+        path, n = line.split(' ')
+        assert path.split(';')[0] == 'parse'
+        assert int(n) >= 0
+
+    # A ParseProfile can be shared to aggregate over specs.
+    prof = sp.profile
+    SpecParser(es.spec, profile = prof).parse()
+    assert prof.stats['parse'].calls == 2
+
 ####
 # Helpers.
 ####